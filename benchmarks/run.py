@@ -0,0 +1,188 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Usage:
+    run.py [<scenario> ...] [--hosts=N] [--items=N] [--graphs=N] [--history=N] [--iterations=N]
+           [--threads=N] [--latency=SECONDS] [--gzip] [--compress-requests-over=BYTES] [--report] [--memory]
+           [(-v | --verbose)]
+    run.py (-h | --help)
+
+Arguments:
+  scenario      scenario(s) to run (default: all) - single, large_get, large_get_compact, history, concurrent,
+                graph_export, bulk_create
+
+Options:
+  -h, --help
+  -v, --verbose          Whether to use verbose logging [default: False]
+  --hosts=N              Synthetic hosts on stub server [default: 100]
+  --items=N              Synthetic items per host [default: 50]
+  --graphs=N             Synthetic graphs per host [default: 5]
+  --history=N            Synthetic history values per item [default: 10]
+  --iterations=N         Calls per scenario [default: 200]
+  --threads=N            Threads for concurrent scenario [default: 8]
+  --latency=SECONDS      Simulated server processing time per request [default: 0]
+  --gzip                 Whether stub server gzips JSON-RPC responses
+  --compress-requests-over=BYTES  Gzip request bodies larger than BYTES
+  --report               Whether to print per method metrics (including bytes saved by compression)
+  --memory               Whether to print memory held (and peak) by item.get results as dicts vs compact records
+"""
+import sys
+import time
+import logging
+import resource
+import tempfile
+import tracemalloc
+from os import path
+from concurrent.futures import ThreadPoolExecutor
+from docopt import docopt
+
+sys.path.insert(0, path.dirname(path.dirname(path.abspath(__file__))))
+
+from pybix import GraphImageAPI  # noqa: E402
+from pybix.metrics import percentile, MetricsAggregator  # noqa: E402
+from benchmarks.stub_server import StubZabbixServer  # noqa: E402
+
+logger = logging.getLogger(__name__)
+
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of this process in MB (ru_maxrss is KB on Linux, bytes on macOS)"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def measure(fn, iterations: int, threads: int = 1) -> dict:
+    """Call fn iterations times (across threads) and measure latency/throughput
+
+    Arguments:
+        fn {callable} -- Function taking no arguments to benchmark
+        iterations {int} -- Number of calls
+        threads {int} -- Number of threads to spread calls across (default: 1)
+
+    Returns:
+        results {dict} -- ops/sec, p50/p95/p99 latency (ms) and peak RSS (MB)
+    """
+    def timed(_):
+        start = time.perf_counter()
+        fn()
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    if threads > 1:
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            latencies = list(executor.map(timed, range(iterations)))
+    else:
+        latencies = [timed(n) for n in range(iterations)]
+    elapsed = time.perf_counter() - start
+
+    return {
+        'ops/sec': iterations / elapsed,
+        'p50 ms': percentile(latencies, 50) * 1000,
+        'p95 ms': percentile(latencies, 95) * 1000,
+        'p99 ms': percentile(latencies, 99) * 1000,
+        'peak RSS MB': peak_rss_mb(),
+    }
+
+
+def retained_mb(fn) -> tuple:
+    """Memory allocated by fn that is still held by its result, and peak while calling it, in MB"""
+    tracemalloc.start()
+    try:
+        result = fn()  # noqa: F841 - held so its memory is counted
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return current / (1024 * 1024), peak / (1024 * 1024)
+
+
+def scenario_single(ZAPI, GRAPH, arguments):
+    return measure(lambda: ZAPI.apiinfo.version(), int(arguments['--iterations']))
+
+
+def scenario_large_get(ZAPI, GRAPH, arguments):
+    return measure(lambda: ZAPI.item.get(output='extend'), max(int(arguments['--iterations']) // 20, 1))
+
+
+def scenario_large_get_compact(ZAPI, GRAPH, arguments):
+    return measure(lambda: ZAPI.item.get(output='extend', compact=True), max(int(arguments['--iterations']) // 20, 1))
+
+
+def scenario_history(ZAPI, GRAPH, arguments):
+    itemids = [item['itemid'] for item in ZAPI.item.get(output=['itemid'], limit=100)]
+    return measure(lambda: ZAPI.history.get(itemids=itemids, history=0), int(arguments['--iterations']))
+
+
+def scenario_concurrent(ZAPI, GRAPH, arguments):
+    return measure(lambda: ZAPI.host.get(output=['hostid', 'host'], limit=10),
+                   int(arguments['--iterations']),
+                   threads=int(arguments['--threads']))
+
+
+def scenario_graph_export(ZAPI, GRAPH, arguments):
+    graphid = ZAPI.graph.get(output=['graphid'], limit=1)[0]['graphid']
+    return measure(lambda: GRAPH.get_by_graph_id(graphid), int(arguments['--iterations']))
+
+
+def scenario_bulk_create(ZAPI, GRAPH, arguments):
+    hosts = [{'host': f"bulk{n}", 'groups': [{'groupid': '2'}]} for n in range(int(arguments['--hosts']) * 10)]
+    return measure(lambda: ZAPI.bulk('host.create', hosts, chunk_size=100, workers=int(arguments['--threads'])),
+                   max(int(arguments['--iterations']) // 20, 1))
+
+
+SCENARIOS = {
+    'single': scenario_single,
+    'large_get': scenario_large_get,
+    'large_get_compact': scenario_large_get_compact,
+    'history': scenario_history,
+    'concurrent': scenario_concurrent,
+    'graph_export': scenario_graph_export,
+    'bulk_create': scenario_bulk_create,
+}
+
+
+def main():
+    arguments = docopt(__doc__)
+    logging.basicConfig(level=logging.DEBUG if arguments['--verbose'] else logging.WARN)
+
+    scenarios = arguments['<scenario>'] or list(SCENARIOS)
+    unknown = [scenario for scenario in scenarios if scenario not in SCENARIOS]
+    if unknown:
+        logger.error(f"Unknown scenario(s) {unknown}, expecting {list(SCENARIOS)}")
+        exit(1)
+
+    with StubZabbixServer(hosts=int(arguments['--hosts']),
+                          items_per_host=int(arguments['--items']),
+                          graphs_per_host=int(arguments['--graphs']),
+                          history_per_item=int(arguments['--history']),
+                          latency=float(arguments['--latency']),
+                          gzip_responses=arguments['--gzip']) as STUB, \
+            tempfile.TemporaryDirectory() as output_path:
+        GRAPH = GraphImageAPI(url=STUB.url, output_path=output_path)
+        ZAPI = GRAPH.ZAPI
+        if arguments['--compress-requests-over']:
+            ZAPI.COMPRESS_REQUESTS_OVER = int(arguments['--compress-requests-over'])
+        METRICS = MetricsAggregator()
+        GRAPH.add_hook(METRICS)
+
+        print(f"{'scenario':<18} {'ops/sec':>10} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'peak RSS MB':>12}")
+        for scenario in scenarios:
+            results = SCENARIOS[scenario](ZAPI, GRAPH, arguments)
+            print(f"{scenario:<18} {results['ops/sec']:>10.1f} {results['p50 ms']:>9.2f} "
+                  f"{results['p95 ms']:>9.2f} {results['p99 ms']:>9.2f} {results['peak RSS MB']:>12.1f}")
+
+        if arguments['--memory']:
+            print()
+            print(f"{'item.get result':<18} {'held MB':>10} {'peak MB':>9}")
+            for name, compact in (('dicts', False), ('compact', True)):
+                held, peak = retained_mb(lambda: ZAPI.do_request('item.get', {'output': 'extend'}, compact=compact))
+                print(f"{name:<18} {held:>10.1f} {peak:>9.1f}")
+
+        ZAPI.logout()
+
+        if arguments['--report']:
+            print()
+            print(METRICS.report())
+
+
+if __name__ == '__main__':
+    main()
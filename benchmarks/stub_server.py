@@ -0,0 +1,265 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Stub Server
+    Contains an in-process stub Zabbix server (JSON-RPC API and frontend chart.php/chart2.php)
+    serving synthetic hosts, items, graphs and history at configurable scale
+"""
+
+import json
+import time
+import uuid
+import struct
+import zlib
+import gzip
+import logging
+import threading
+import socketserver
+from http.server import HTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse
+
+logger = logging.getLogger(__name__)
+
+
+def synthetic_png(size: int) -> bytes:
+    """Valid PNG of roughly size bytes (random-ish pixel data so it doesn't compress away)
+
+    Arguments:
+        size {int} -- Approximate size of PNG in bytes
+
+    Returns:
+        png {bytes} -- The PNG image
+    """
+    def chunk(kind, data):
+        return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data))
+
+    width = 256
+    height = max(size // (width * 3), 1)
+    rows = b''.join(b'\x00' + bytes((x * 7 + y * 13) % 256 for x in range(width * 3)) for y in range(height))
+    return (b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0))
+            + chunk(b'IDAT', zlib.compress(rows, 0)) + chunk(b'IEND', b''))
+
+
+class StubZabbixData(object):
+    """Synthetic Zabbix configuration and history"""
+
+    def __init__(self,
+                 hosts: int = 100,
+                 items_per_host: int = 50,
+                 graphs_per_host: int = 5,
+                 history_per_item: int = 10):
+        """Generate synthetic data
+
+        Arguments:
+            hosts {int} -- Number of hosts (default: 100)
+            items_per_host {int} -- Number of items per host (default: 50)
+            graphs_per_host {int} -- Number of graphs per host (default: 5)
+            history_per_item {int} -- Number of history values per item (default: 10)
+        """
+        self.HISTORY_PER_ITEM = history_per_item
+        self.HOSTS = [{
+            'hostid': str(10000 + h),
+            'host': f"server{h}",
+            'name': f"Server {h}",
+            'status': '0',
+            'available': '1',
+            'description': '',
+        } for h in range(hosts)]
+        self.ITEMS = [{
+            'itemid': str(100000 + h * items_per_host + i),
+            'hostid': host['hostid'],
+            'name': f"Metric {i} on {host['host']}",
+            'key_': f"custom.metric[{i}]",
+            'type': '2',
+            'value_type': '0',
+            'delay': '1m',
+            'history': '90d',
+            'units': 'B',
+            'status': '0',
+            'lastclock': '1564790400',
+            'lastvalue': f"{i * 1.5:.4f}",
+        } for h, host in enumerate(self.HOSTS) for i in range(items_per_host)]
+        self.GRAPHS = [{
+            'graphid': str(5000 + h * graphs_per_host + g),
+            'hostid': host['hostid'],
+            'name': f"Graph {g} on {host['host']}",
+            'width': '900',
+            'height': '200',
+            'graphtype': '0',
+        } for h, host in enumerate(self.HOSTS) for g in range(graphs_per_host)]
+
+    def history(self, itemids: list) -> list:
+        return [{
+            'itemid': itemid,
+            'clock': str(1564790400 - n * 60),
+            'value': f"{n * 0.25:.4f}",
+            'ns': '0',
+        } for itemid in itemids for n in range(self.HISTORY_PER_ITEM)]
+
+
+def _select(rows: list, params: dict, id_filters: tuple) -> list:
+    """Apply the subset of *.get parameters the stub supports (id filters, output, limit)"""
+    for key in id_filters:
+        if params.get(key):
+            wanted = params[key] if isinstance(params[key], list) else [params[key]]
+            wanted = {str(value) for value in wanted}
+            field = key[:-1]  # e.g. hostids -> hostid
+            rows = [row for row in rows if row[field] in wanted]
+
+    if params.get('limit'):
+        rows = rows[:int(params['limit'])]
+
+    output = params.get('output', 'extend')
+    if isinstance(output, list):
+        rows = [{field: row[field] for field in output if field in row} for row in rows]
+    return rows
+
+
+class StubZabbixHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Headers and body are written separately, so avoid Nagle delaying the body on keep-alive connections
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        logger.debug(f"StubZabbixHandler: {format % args}")
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        if self.headers.get('Content-Encoding') == 'gzip':
+            body = gzip.decompress(body)
+        path = urlparse(self.path).path
+        self.server.delay()
+
+        if path.endswith('/index.php'):
+            self._send(200, b'', 'text/html', {'Set-Cookie': f"zbx_session={uuid.uuid4().hex}; Path=/"})
+        elif path.endswith('/api_jsonrpc.php'):
+            request = json.loads(body)
+            result = self.server.call(request['method'], request.get('params') or {})
+            if isinstance(result, Exception):
+                response = {'jsonrpc': '2.0', 'error': {'code': -32602, 'message': 'Invalid params.',
+                                                        'data': str(result)}, 'id': request['id']}
+            else:
+                response = {'jsonrpc': '2.0', 'result': result, 'id': request['id']}
+            data = json.dumps(response).encode('utf-8')
+            if self.server.GZIP_RESPONSES and 'gzip' in self.headers.get('Accept-Encoding', ''):
+                self._send(200, gzip.compress(data, compresslevel=1), 'application/json',
+                           {'Content-Encoding': 'gzip'})
+            else:
+                self._send(200, data, 'application/json')
+        else:
+            self._send(404, b'', 'text/html')
+
+    def do_GET(self):
+        path = urlparse(self.path).path
+        self.server.delay()
+
+        if path.endswith('/chart.php') or path.endswith('/chart2.php'):
+            self._send(200, self.server.PNG, 'image/png')
+        else:
+            self._send(404, b'', 'text/html')
+
+    def _send(self, status: int, data: bytes, content_type: str, headers: dict = None):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(data)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+
+class StubZabbixServer(socketserver.ThreadingMixIn, HTTPServer):
+    """In-process stub Zabbix server, e.g.
+
+        with StubZabbixServer(hosts=1000) as STUB:
+            ZAPI = ZabbixAPI(STUB.url)
+    """
+    daemon_threads = True
+
+    def __init__(self,
+                 hosts: int = 100,
+                 items_per_host: int = 50,
+                 graphs_per_host: int = 5,
+                 history_per_item: int = 10,
+                 latency: float = 0.0,
+                 image_size: int = 30000,
+                 gzip_responses: bool = False,
+                 port: int = 0):
+        """Initialise the stub server on 127.0.0.1 (call start() to begin serving)
+
+        Arguments:
+            hosts {int} -- Number of hosts (default: 100)
+            items_per_host {int} -- Number of items per host (default: 50)
+            graphs_per_host {int} -- Number of graphs per host (default: 5)
+            history_per_item {int} -- Number of history values per item (default: 10)
+            latency {float} -- Seconds to sleep before each response to simulate server processing (default: 0.0)
+            image_size {int} -- Approximate size in bytes of chart images (default: 30000)
+            gzip_responses {bool} -- Whether to gzip JSON-RPC responses if client accepts gzip (default: False)
+            port {int} -- Port to listen on (default: 0 - any free port)
+        """
+        super().__init__(('127.0.0.1', port), StubZabbixHandler)
+        self.DATA = StubZabbixData(hosts, items_per_host, graphs_per_host, history_per_item)
+        self.LATENCY = latency
+        self.PNG = synthetic_png(image_size)
+        self.GZIP_RESPONSES = gzip_responses
+        self.CALLS = {}
+        self.LOCK = threading.Lock()
+        self.THREAD = None
+        self.NEXT_ID = 900000000
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exception_type, exception_value, traceback):
+        self.stop()
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}/zabbix"
+
+    def start(self):
+        self.THREAD = threading.Thread(target=self.serve_forever, daemon=True)
+        self.THREAD.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def delay(self):
+        if self.LATENCY:
+            time.sleep(self.LATENCY)
+
+    def call(self, method: str, params):
+        """Handle a JSON-RPC method, returning result or Exception for error response"""
+        with self.LOCK:
+            self.CALLS[method] = self.CALLS.get(method, 0) + 1
+
+        obj, _, action = method.partition('.')
+        if method == 'apiinfo.version':
+            return '4.0.0'
+        elif method == 'user.login':
+            return uuid.uuid4().hex
+        elif method in ('user.logout', 'user.checkAuthentication'):
+            return True
+        elif method == 'host.get':
+            return _select(self.DATA.HOSTS, params, ('hostids',))
+        elif method == 'item.get':
+            return _select(self.DATA.ITEMS, params, ('hostids', 'itemids'))
+        elif method == 'graph.get':
+            return _select(self.DATA.GRAPHS, params, ('hostids', 'graphids'))
+        elif method == 'history.get':
+            return _select(self.DATA.history(params.get('itemids') or []), params, ())
+        elif action == 'create':
+            objects = params if isinstance(params, list) else [params]
+            with self.LOCK:
+                ids = [str(self.NEXT_ID + n) for n in range(len(objects))]
+                self.NEXT_ID += len(objects)
+            return {f"{obj}ids": ids}
+        elif action == 'update':
+            objects = params if isinstance(params, list) else [params]
+            return {f"{obj}ids": [str(o[f"{obj}id"]) for o in objects]}
+        elif action == 'massupdate':
+            return {f"{obj}ids": [str(o[f"{obj}id"]) for o in params.get(f"{obj}s", [])]}
+        elif action == 'delete':
+            return {f"{obj}ids": [str(objectid) for objectid in params]}
+        return ValueError(f"Stub does not support method {method}")
@@ -2,6 +2,8 @@
 # -*- coding: utf-8 -*-
 """
 Usage:
+    pybix.py serve [--zabbix-server=ZABBIX_SERVER] [--zabbix-user=ZABBIX_USER] [--zabbix-password=ZABBIX_PASSWORD]
+            [--ignore-ssl-verify] [--output-path=PATH] [--host=HOST] [--port=PORT] [--socket=PATH] [(-v | --verbose)]
     pybix.py <method> [--zabbix-server=ZABBIX_SERVER] [--zabbix-user=ZABBIX_USER]
             [--zabbix-password=ZABBIX_PASSWORD] [--ignore-ssl-verify] [(-v | --verbose)] [<args> ...]
     pybix.py (-h | --help)
@@ -10,6 +12,7 @@ Usage:
 Arguments:
   method        either Zabbix API reference as '<object>.<action>' or GraphImage API as 'graphimage.<search_type>' (e.g. 'host.get' or 'graphimage.graph_id')
   args          what arguments to pass to API call
+  serve         run a long-running local server that keeps Zabbix sessions logged in
 
 Options:
   -h, --help
@@ -20,6 +23,9 @@ Options:
   --zabbix-user=ZABBIX_USER          Username - default: ZABBIX_USER env or Admin
   --zabbix-password=ZABBIX_PASSWORD  Password - default: ZABBIX_PASSWORD env or zabbix
   --ignore-ssl-verify                Whether to ignore SSL verification for API [default: False]
+  --host=HOST                        Address for serve to listen on [default: 127.0.0.1]
+  --port=PORT                        Port for serve to listen on [default: 8090]
+  --socket=PATH                      Unix socket for serve to listen on instead of host/port
 """
 from docopt import docopt
 from os import path, environ
@@ -27,6 +33,7 @@ import re
 import ast
 import logging.config
 import pybix
+from pybix import server
 
 logger = logging.getLogger(__name__)
 
@@ -34,6 +41,9 @@ logger = logging.getLogger(__name__)
 def validate_arguments(arguments):
     error = ""
 
+    if arguments['serve']:
+        return
+
     if arguments['<method>'] and "." not in arguments['<method>']:
         error = "Missing fullstop so appears invalid (expecting 'object.method', e.g. 'host.get' or 'graphimage.graph_name')"
     elif arguments['<method>'] and arguments['<method>'].count('.') > 1:
@@ -60,6 +70,9 @@ def main():
         logging.getLogger().setLevel(logging.DEBUG)
     logger.debug(arguments)
 
+    if arguments['serve']:
+        serve(arguments)
+
     # Format args into dictionary to pass later
     try:
         FORMATTED_ARGUMENTS = {
@@ -133,5 +146,26 @@ def main():
     exit(0)
 
 
+def serve(arguments):
+    URL = arguments['--zabbix-server'] or environ.get(
+        'ZABBIX_SERVER') or 'http://localhost/zabbix'
+    SSL_VERIFY = not arguments['--ignore-ssl-verify'] or False
+
+    PYBIX = server.PybixServer(url=URL,
+                               user=arguments['--zabbix-user'],
+                               password=arguments['--zabbix-password'],
+                               output_path=arguments['--output-path'],
+                               ssl_verify=SSL_VERIFY)
+    try:
+        server.serve(PYBIX,
+                     host=arguments['--host'],
+                     port=arguments['--port'],
+                     socket_path=arguments['--socket'])
+    except (ValueError, OSError) as ex:
+        logger.error(f"Unable to serve: {ex}")
+        exit(1)
+    exit(0)
+
+
 if __name__ == '__main__':
     main()
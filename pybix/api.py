@@ -9,9 +9,30 @@ import os
 import requests
 import json
 import logging
+import threading
+import time
+import gzip
+from pybix.metrics import EventHooks, RequestEvent
+from pybix.limiter import AdaptiveLimiter, throttle
+from pybix.singleflight import SingleFlight
+from pybix.bulk import BulkResult, bulk as send_bulk
+from pybix.feed import ChangeFeed
+from pybix.compact import decode_response
+from pybix.balancer import frontend_pool
 
 logger = logging.getLogger(__name__)
 
+# Response encodings urllib3 can decode (i.e. gzip, deflate and br if brotli is installed)
+ACCEPT_ENCODING = urllib3.util.make_headers(accept_encoding=True)['accept-encoding']
+
+# Read only methods, other than '*.get', whose identical concurrent calls can be coalesced
+READ_METHODS = ('apiinfo.version', 'configuration.export')
+
+
+def is_read_method(method: str) -> bool:
+    """Whether method only reads, so identical calls can be coalesced or sent twice (hedged)"""
+    return method.endswith('.get') or method in READ_METHODS
+
 
 class ZabbixAPIException(Exception):
     """ Zabbix API Exception
@@ -27,36 +48,65 @@ class ZabbixAPIException(Exception):
     pass
 
 
-class ZabbixAPI(object):
-    def __init__(self, url: str = None, timeout: int = None, ssl_verify=True):
+class ZabbixAPI(EventHooks):
+    def __init__(self,
+                 url=None,
+                 timeout: int = None,
+                 ssl_verify=True,
+                 session: requests.Session = None,
+                 limiter: AdaptiveLimiter = None,
+                 coalesce: bool = False,
+                 compress_requests_over: int = None):
         """Initialise the ZabbixAPI (but not login)
 
         Arguments:
-            url {str} -- Base URL to Zabbix (default: ZABBIX_SERVER environment variable or https://localhost/zabbix)
+            url {str|list|FrontendPool} -- Base URL to Zabbix, or URLs (list or comma separated) of frontends
+                                           sharing one database to balance requests across
+                                           (default: ZABBIX_SERVER environment variable or https://localhost/zabbix)
             timeout {int} -- Timeout for API request in seconds
                              (default: ZABBIX_SESSION_TIMEOUT environment variable or None - don't timeout)
             ssl_verify {bool} -- Whether to attempt SSL verification during call (default: True)
+            session {requests.Session} -- Existing session to share connection pool with, e.g. GraphImage
+                                          (default: None - create new session)
+            limiter {AdaptiveLimiter} -- Limiter to throttle requests with, e.g. AdaptiveLimiter.for_server(url)
+                                         (default: None - no throttling)
+            coalesce {bool} -- Whether identical concurrent read calls (e.g. '*.get') share one request and
+                               result, so results must not be mutated (default: False)
+            compress_requests_over {int} -- Gzip request bodies larger than this many bytes, the frontend's web
+                                            server must decode gzip request bodies (default: None - don't compress)
         """
         url = url or os.environ.get(
             'ZABBIX_SERVER') or 'http://localhost/zabbix'
+        self.POOL = frontend_pool(url)
+        if self.POOL is not None:
+            url = self.POOL.URLS[0]
+        elif not isinstance(url, str):
+            url = url[0]
         self.URL = f"{url}/api_jsonrpc.php" if not url.endswith(
             '/api_jsonrpc.php') else url
 
         # Zabbix auth specific
         self.AUTH = ''
         self.ID = 0
+        self.LOCK = threading.Lock()
+        self.HOOKS = []
 
         # Requests specific
         self.TIMEOUT = timeout or os.environ.get(
             'ZABBIX_SESSION_TIMEOUT') or None
-        self.SESSION = requests.Session()
+        self.SESSION = session or requests.Session()
         self.SESSION.headers.update({
-            'Content-Type': 'application/json-rpc',
             'User-Agent': 'python/pybix',
-            'Cache-Control': 'no-cache'
+            'Cache-Control': 'no-cache',
+            'Accept-Encoding': ACCEPT_ENCODING
         })
+        # Set per request rather than on SESSION so it can be shared with frontend form posts
+        self.HEADERS = {'Content-Type': 'application/json-rpc'}
 
         self.SSL_VERIFY = ssl_verify
+        self.LIMITER = limiter
+        self.SINGLE_FLIGHT = SingleFlight() if coalesce else None
+        self.COMPRESS_REQUESTS_OVER = compress_requests_over
         if not self.SSL_VERIFY:
             urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
@@ -98,21 +148,43 @@ class ZabbixAPI(object):
             if self.user.logout():
                 self.AUTH = ''
 
-    def do_request(self, method: str, params: dict = None) -> dict:
-        """Perform the REST API call
+    def do_request(self, method: str, params: dict = None, compact: bool = False) -> dict:
+        """Perform the REST API call (sharing an identical in-flight read call if coalescing)
 
         Arguments:
             method {str} -- Zabbix API method (e.g. 'host.get')
             params {dict} -- Parameters relevant to API call as per Zabbix documentation
+            compact {bool} -- Whether to decode a list result into compact records, i.e. namedtuples with
+                              int IDs and shared strings (see pybix.compact.RecordBuilder) (default: False)
 
         Returns:
             response {dict} -- The successful JSON response in Python dict format
         """
+        def request():
+            return self._do_request(method, params, compact)
+
+        if self.SINGLE_FLIGHT is None or not is_read_method(method):
+            return request()
+
+        key = (method, self.AUTH, json.dumps(params or {}, sort_keys=True, separators=(',', ':')), compact)
+        start = time.perf_counter()
+        response, shared = self.SINGLE_FLIGHT.do(key, request)
+        if shared and self.HOOKS:
+            self._emit(RequestEvent(method, self.URL, None, None, 0, 0,
+                                    {'total': time.perf_counter() - start}, 0, True))
+        return response
+
+    def _do_request(self, method: str, params: dict = None, compact: bool = False) -> dict:
+        # Claim ID up front so concurrent callers (e.g. pybix serve) don't share IDs
+        with self.LOCK:
+            request_id = self.ID
+            self.ID += 1
+
         request = {
             'jsonrpc': '2.0',
             'method': method,
             'params': params or {},
-            'id': self.ID,
+            'id': request_id,
         }
 
         # Only add auth if method requires it
@@ -120,34 +192,152 @@ class ZabbixAPI(object):
                                          'user.checkAuthentication')):
             request['auth'] = self.AUTH
 
-        logger.debug(
-            f"Sending: {json.dumps(request, indent=4, separators=(',', ': '))}",
-        )
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(
+                f"Sending: {json.dumps(request, indent=4, separators=(',', ': '))}",
+            )
+
+        timings = {}
+        status = None
+        error = None
+        request_bytes = response_bytes = request_wire_bytes = response_wire_bytes = 0
+        url = self.URL
+        start = time.perf_counter()
+        try:
+            data = json.dumps(request).encode('utf-8')
+            request_bytes = len(data)
+            headers = self.HEADERS
+            if self.COMPRESS_REQUESTS_OVER is not None and request_bytes > self.COMPRESS_REQUESTS_OVER:
+                data = gzip.compress(data, compresslevel=6)
+                headers = dict(self.HEADERS, **{'Content-Encoding': 'gzip'})
+            request_wire_bytes = len(data)
+            timings['encode'] = time.perf_counter() - start
+
+            with throttle(self.LIMITER, timings):
+                response = self._post(data, headers, method)
+                url = response.url  # Frontend that responded, if balancing across POOL
+                status = response.status_code
+                timings['wait'] = response.elapsed.total_seconds()
+
+                downloading = time.perf_counter()
+                content = response.content
+                response_bytes = len(content)
+                response_wire_bytes = response.raw.tell()  # Bytes read before decoding, i.e. compressed size
+                timings['download'] = time.perf_counter() - downloading
+                response.raise_for_status()
+
+            decoding = time.perf_counter()
+            try:
+                if compact:
+                    # Rows become records as they are decoded, so are never all held as dicts
+                    response_json = decode_response(content, output=(params or {}).get('output'))
+                else:
+                    response_json = json.loads(content)
+            except ValueError:
+                raise ZabbixAPIException(f"Unable to parse json: {response.text}")
+            timings['decode'] = time.perf_counter() - decoding
+
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug(
+                    f"Received: {json.dumps(response_json, indent=4, separators=(',', ': '))}",
+                )
+
+            if 'error' in response_json:
+                raise ZabbixAPIException(
+                    f"Error {response_json['error']['code']}: {response_json['error']['message']},"
+                    f" {response_json['error']['data']}",
+                    response_json['error']['code'])
+        except Exception as ex:
+            error = ex
+            status = status or getattr(getattr(ex, 'response', None), 'status_code', None)
+            raise
+        finally:
+            if self.HOOKS:
+                timings['total'] = time.perf_counter() - start
+                self._emit(RequestEvent(method, url, status, error, request_bytes, response_bytes,
+                                        timings, 0, False, request_wire_bytes, response_wire_bytes))
+
+        return response_json
 
-        response = self.SESSION.post(self.URL,
-                                     data=json.dumps(request),
+    def _post(self, data: bytes, headers: dict, method: str) -> requests.Response:
+        """POST the encoded request to URL, or to a frontend of POOL (hedging if a read)
+
+        Returns:
+            response {requests.Response} -- Streamed response (already read if from POOL)
+        """
+        if self.POOL is None:
+            return self.SESSION.post(self.URL,
+                                     data=data,
+                                     headers=headers,
                                      timeout=self.TIMEOUT,
-                                     verify=self.SSL_VERIFY)
-        response.raise_for_status()
+                                     verify=self.SSL_VERIFY,
+                                     stream=True)
+
+        def post(base_url: str) -> requests.Response:
+            response = self.SESSION.post(f"{base_url}/api_jsonrpc.php",
+                                         data=data,
+                                         headers=headers,
+                                         timeout=self.TIMEOUT,
+                                         verify=self.SSL_VERIFY,
+                                         stream=True)
+            # Read body here so the frontend's latency includes it and a losing hedged request frees its connection
+            response.content
+            response.raise_for_status()  # So POOL sees failures
+            return response
+
+        return self.POOL.call(post, is_read_method(method), method)
+
+    def bulk(self,
+             method: str,
+             objects: list,
+             chunk_size: int = 500,
+             max_bytes: int = 1024 * 1024,
+             workers: int = 4,
+             retries: int = 0,
+             key: str = None,
+             common: dict = None) -> BulkResult:
+        """Send a large create/update/delete/massupdate in chunks of at most chunk_size objects and max_bytes,
+            with workers requests in flight at once. Note retried chunks may have partially succeeded on the
+            server (e.g. a timed out create), so may fail again with 'already exists'
+
+            e.g.
+                result = ZAPI.bulk('host.create', hosts, workers=8, retries=1)
+                result = ZAPI.bulk('host.delete', hostids)
+                result = ZAPI.bulk('host.massupdate', [{'hostid': '10084'}, ...], key='hosts', common={'status': 1})
 
-        try:
-            response_json = json.loads(response.text)
-        except ValueError:
-            raise ZabbixAPIException(f"Unable to parse json: {response.text}")
+        Arguments:
+            method {str} -- Zabbix API method (e.g. 'host.create', 'item.update', 'host.delete', 'host.massupdate')
+            objects {list} -- Objects (or IDs for delete) to send
+            chunk_size {int} -- Most objects per request (default: 500)
+            max_bytes {int} -- Most JSON bytes of objects per request (default: 1MB)
+            workers {int} -- Requests in flight at once (default: 4)
+            retries {int} -- Times to retry failed chunks, after all chunks have been tried once (default: 0)
+            key {str} -- Send params as {key: chunk, **common} rather than chunk, e.g. 'hosts' for
+                         'host.massupdate' (default: None)
+            common {dict} -- Parameters sent with every chunk when key is set, e.g. {'status': 1} (default: None)
+
+        Returns:
+            result {BulkResult} -- IDs returned in input order (result.IDS) and failed chunks (result.ERRORS)
+        """
+        return send_bulk(self, method, objects, chunk_size, max_bytes, workers, retries, key, common)
 
-        self.ID += 1
+    def follow(self, object_name: str = 'event', **kwargs) -> ChangeFeed:
+        """Follow new events or problems as they occur, polling only for records after the last one seen
 
-        logger.debug(
-            f"Sending: {json.dumps(response_json, indent=4, separators=(',', ': '))}",
-        )
+            e.g.
+                for event in ZAPI.follow('event', params={'source': 0}, checkpoint='events.json'):
+                    ...
+                async for problem in ZAPI.follow('problem', params={'severities': [4, 5]}):
+                    ...
 
-        if 'error' in response_json:
-            raise ZabbixAPIException(
-                f"Error {response_json['error']['code']}: {response_json['error']['message']},"
-                f" {response_json['error']['data']}",
-                response_json['error']['code'])
+        Arguments:
+            object_name {str} -- Zabbix API object to follow, 'event' or 'problem' (default: event)
+            **kwargs -- Passed to ChangeFeed, e.g. params, output, checkpoint, since, interval, max_interval, limit
 
-        return response_json
+        Returns:
+            feed {ChangeFeed} -- Iterable (and async iterable) of new records
+        """
+        return ChangeFeed(self, object_name, **kwargs)
 
     def check_authentication(self) -> dict:
         """Convenience method for calling user.checkAuthentication of the current session
@@ -193,11 +383,12 @@ class ZabbixObject(object):
     def __getattr__(self, name):
         """Dynamically create a method (ie: get)"""
 
-        def fn(*args, **kwargs):
+        def fn(*args, compact: bool = False, **kwargs):
+            # compact is handled by do_request, so isn't sent to Zabbix
             if args and kwargs:
                 raise TypeError("Found both args and kwargs")
 
             return self.PARENT.do_request('{0}.{1}'.format(self.NAME, name),
-                                          args or kwargs)['result']
+                                          args or kwargs, compact)['result']
 
         return fn
@@ -0,0 +1,238 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Balancer
+    Contains load balancing of requests across multiple (HA) Zabbix frontends, with temporary
+    ejection of failing/slow frontends and hedged (duplicate) reads to cut tail latency
+"""
+
+import time
+import logging
+import threading
+from itertools import count
+from concurrent.futures import ThreadPoolExecutor, TimeoutError, wait, FIRST_COMPLETED
+from pybix.limiter import is_overload
+
+logger = logging.getLogger(__name__)
+
+
+class Frontend(object):
+    """State of one frontend in a FrontendPool"""
+
+    def __init__(self, url: str):
+        self.URL = url
+        self.OUTSTANDING = 0  # Requests in flight
+        self.LATENCY = {}  # method: Moving average of successful request seconds
+        self.SAMPLES = {}  # method: Successful requests averaged
+        self.FAILURES = 0  # Consecutive failures due to overload/connection errors
+        self.EJECTED_UNTIL = 0.0
+
+    def __repr__(self):
+        return f"Frontend({self.URL}, outstanding={self.OUTSTANDING}, failures={self.FAILURES})"
+
+    @property
+    def is_ejected(self) -> bool:
+        return time.monotonic() < self.EJECTED_UNTIL
+
+
+class FrontendPool(object):
+    """Spreads requests across frontend URLs sharing one Zabbix database (so one API auth token), e.g.
+
+        POOL = FrontendPool(['https://zabbix1/zabbix', 'https://zabbix2/zabbix'], hedge_after=0.5)
+        ZAPI = ZabbixAPI(POOL)
+
+        Each request goes to the frontend with the fewest requests in flight (round robin between equals).
+        A frontend is ejected for eject_seconds after max_failures consecutive overload/connection errors,
+        or when its average latency for a method is over slow_latency and slow_factor times that of the
+        fastest frontend for the same method (once both have min_samples requests of it), so heavy calls
+        (e.g. a large item.get) aren't compared against light ones (e.g. apiinfo.version).
+        The last frontend in the pool is never ejected. Read requests still running after hedge_after
+        seconds are sent again to another frontend, and whichever responds first is used.
+    """
+
+    def __init__(self,
+                 urls: list,
+                 hedge_after: float = None,
+                 max_failures: int = 3,
+                 eject_seconds: float = 30,
+                 slow_latency: float = 1.0,
+                 slow_factor: float = 3.0,
+                 min_samples: int = 5,
+                 workers: int = 32):
+        """Initialise the pool
+
+        Arguments:
+            urls {list(str)} -- Base URLs of the frontends (e.g. https://zabbix1/zabbix)
+            hedge_after {float} -- Seconds after which read requests are also sent to another frontend
+                                   (default: None - don't hedge)
+            max_failures {int} -- Consecutive failures after which a frontend is ejected (default: 3)
+            eject_seconds {float} -- Seconds a frontend is ejected for (default: 30)
+            slow_latency {float} -- Average seconds a frontend must exceed to be ejected as slow (default: 1.0)
+            slow_factor {float} -- Times slower than the fastest frontend to be ejected as slow (default: 3.0)
+            min_samples {int} -- Requests of a method each frontend must have served before comparing their
+                                 latency (default: 5)
+            workers {int} -- Most hedged requests (both original and duplicate) in flight at once (default: 32)
+        """
+        if not urls:
+            raise ValueError("FrontendPool requires at least one URL")
+        self.FRONTENDS = [Frontend(base_url(url)) for url in urls]
+        self.HEDGE_AFTER = hedge_after
+        self.MAX_FAILURES = max_failures
+        self.EJECT_SECONDS = eject_seconds
+        self.SLOW_LATENCY = slow_latency
+        self.SLOW_FACTOR = slow_factor
+        self.MIN_SAMPLES = min_samples
+        self.WORKERS = workers
+        self.EXECUTOR = None
+        self.LOCK = threading.Lock()
+        self.COUNTER = count()
+        self.HEDGES = 0  # Requests sent again to another frontend
+        self.HEDGE_WINS = 0  # Of which the duplicate responded first
+
+    def __repr__(self):
+        return f"FrontendPool({self.FRONTENDS})"
+
+    @property
+    def URLS(self) -> list:
+        return [frontend.URL for frontend in self.FRONTENDS]
+
+    def acquire(self, exclude: tuple = ()) -> Frontend:
+        """Pick the non ejected frontend with the fewest requests in flight and count a request against it
+            (if all are ejected, the one whose ejection ends soonest)
+
+        Arguments:
+            exclude {tuple(Frontend)} -- Frontends not to pick, e.g. the one a request is being hedged from
+
+        Returns:
+            frontend {Frontend} -- Frontend to send to, or None if all were excluded
+        """
+        with self.LOCK:
+            candidates = [frontend for frontend in self.FRONTENDS if frontend not in exclude]
+            if not candidates:
+                return None
+            healthy = [frontend for frontend in candidates if not frontend.is_ejected]
+            if healthy:
+                start = next(self.COUNTER) % len(healthy)
+                frontend = min(healthy[start:] + healthy[:start], key=lambda frontend: frontend.OUTSTANDING)
+            else:
+                frontend = min(candidates, key=lambda frontend: frontend.EJECTED_UNTIL)
+            frontend.OUTSTANDING += 1
+            return frontend
+
+    def release(self, frontend: Frontend, seconds: float, error: Exception = None, method: str = None):
+        """Record the outcome of a request, ejecting the frontend if failing or slow
+
+        Arguments:
+            frontend {Frontend} -- Frontend returned by acquire
+            seconds {float} -- Duration of the request
+            error {Exception} -- Exception raised by the request (default: None - succeeded)
+            method {str} -- What was requested (e.g. 'item.get'), latency is only compared between frontends
+                            for the same method (default: None)
+        """
+        with self.LOCK:
+            frontend.OUTSTANDING -= 1
+            if error is not None:
+                if not is_overload(error):
+                    return  # e.g. invalid parameters, not the frontend's fault
+                frontend.FAILURES += 1
+                if frontend.FAILURES >= self.MAX_FAILURES:
+                    self._eject(frontend, f"{frontend.FAILURES} consecutive failures ({error})")
+                return
+
+            frontend.FAILURES = 0
+            latency = frontend.LATENCY.get(method)
+            latency = frontend.LATENCY[method] = seconds if latency is None else 0.7 * latency + 0.3 * seconds
+            frontend.SAMPLES[method] = frontend.SAMPLES.get(method, 0) + 1
+            if frontend.SAMPLES[method] < self.MIN_SAMPLES:
+                return
+            fastest = min((other.LATENCY[method] for other in self.FRONTENDS
+                           if other is not frontend and not other.is_ejected
+                           and other.SAMPLES.get(method, 0) >= self.MIN_SAMPLES),
+                          default=None)
+            if fastest is not None and latency > self.SLOW_LATENCY and latency > self.SLOW_FACTOR * fastest:
+                self._eject(frontend, f"average {method} latency {latency:.3f}s vs {fastest:.3f}s")
+
+    def _eject(self, frontend: Frontend, reason: str):
+        """Eject frontend unless it is the last one not ejected (called with LOCK held)"""
+        if not any(other is not frontend and not other.is_ejected for other in self.FRONTENDS):
+            return
+        logger.warning(f"FrontendPool: Ejecting {frontend.URL} for {self.EJECT_SECONDS}s, {reason}")
+        frontend.EJECTED_UNTIL = time.monotonic() + self.EJECT_SECONDS
+        frontend.FAILURES = 0
+        frontend.LATENCY = {}  # Start afresh once back
+        frontend.SAMPLES = {}
+
+    def _call(self, fn, frontend: Frontend, method: str = None):
+        start = time.perf_counter()
+        try:
+            result = fn(frontend.URL)
+        except Exception as ex:
+            self.release(frontend, time.perf_counter() - start, ex, method)
+            raise
+        self.release(frontend, time.perf_counter() - start, method=method)
+        return result
+
+    def call(self, fn, hedge: bool = False, method: str = None):
+        """Call fn with the base URL of a frontend, hedging on another frontend if allowed and slow
+
+        Arguments:
+            fn {callable} -- Function taking a base URL, which should raise (e.g. HTTPError) on failure
+            hedge {bool} -- Whether fn is safe to call twice, i.e. a read (default: False)
+            method {str} -- What fn requests (e.g. 'item.get'), to compare latency by (default: None)
+
+        Returns:
+            result -- Result of the first successful call of fn
+        """
+        if not hedge or self.HEDGE_AFTER is None or len(self.FRONTENDS) < 2:
+            return self._call(fn, self.acquire(), method)
+
+        with self.LOCK:
+            if self.EXECUTOR is None:
+                self.EXECUTOR = ThreadPoolExecutor(max_workers=self.WORKERS)
+        first = self.acquire()
+        original = self.EXECUTOR.submit(self._call, fn, first, method)
+        try:
+            return original.result(timeout=self.HEDGE_AFTER)
+        except TimeoutError:
+            pass
+
+        second = self.acquire(exclude=(first, ))
+        logger.debug(f"FrontendPool: Hedging request to {first.URL} on {second.URL}")
+        duplicate = self.EXECUTOR.submit(self._call, fn, second, method)
+        with self.LOCK:
+            self.HEDGES += 1
+
+        pending = {original, duplicate}
+        while True:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    if future is duplicate:
+                        with self.LOCK:
+                            self.HEDGE_WINS += 1
+                    return future.result()
+            if not pending:
+                return original.result()  # Both failed, so raise the original's error
+
+
+def base_url(url: str) -> str:
+    """Frontend base URL, i.e. without trailing '/' or '/api_jsonrpc.php'"""
+    url = url.rstrip('/')
+    return url[:-len('/api_jsonrpc.php')] if url.endswith('/api_jsonrpc.php') else url
+
+
+def frontend_pool(url) -> FrontendPool:
+    """FrontendPool for url if it names multiple frontends
+
+    Arguments:
+        url {str|list|FrontendPool} -- URL, comma separated URLs, list of URLs or existing pool
+
+    Returns:
+        pool {FrontendPool} -- Pool of the frontends, or None if url is a single URL
+    """
+    if isinstance(url, FrontendPool):
+        return url
+    if isinstance(url, str):
+        url = [part.strip() for part in url.split(',') if part.strip()]
+    if url is None or len(url) < 2:
+        return None
+    return FrontendPool(url)
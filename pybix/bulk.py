@@ -0,0 +1,132 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Bulk
+    Contains helpers for splitting large create/update/delete/massupdate calls into
+    bounded chunks sent in parallel
+"""
+
+import json
+import logging
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# Chunk of objects[start:end] that failed with error after attempts tries
+BulkError = namedtuple('BulkError', ['start', 'end', 'error', 'attempts'])
+
+
+class BulkResult(object):
+    """Outcome of ZabbixAPI.bulk"""
+
+    def __init__(self, size: int):
+        self.IDS = [None] * size  # IDs returned per input object, None if its chunk failed
+        self.ERRORS = []  # BulkError per chunk that failed (after any retries)
+
+    def __repr__(self):
+        return f"BulkResult(objects={len(self.IDS)}, failed_chunks={len(self.ERRORS)})"
+
+    @property
+    def ok(self) -> bool:
+        """Whether all chunks succeeded"""
+        return not self.ERRORS
+
+    @property
+    def failed_indexes(self) -> list:
+        """Indexes of input objects in failed chunks"""
+        return [index for error in self.ERRORS for index in range(error.start, error.end)]
+
+
+def chunk_ranges(objects: list, chunk_size: int, max_bytes: int = None) -> list:
+    """Split objects into consecutive chunks of at most chunk_size objects and max_bytes of JSON
+
+    Arguments:
+        objects {list} -- Objects to split
+        chunk_size {int} -- Most objects per chunk
+        max_bytes {int} -- Most JSON encoded bytes per chunk, objects larger than this get a chunk
+                           to themselves (default: None - no limit)
+
+    Returns:
+        ranges {list(tuple)} -- (start, end) index of each chunk
+    """
+    ranges = []
+    start = 0
+    size = 0
+    for index, obj in enumerate(objects):
+        obj_size = len(json.dumps(obj, separators=(',', ':'))) + 1 if max_bytes else 0
+        if index > start and (index - start >= chunk_size or (max_bytes and size + obj_size > max_bytes)):
+            ranges.append((start, index))
+            start = index
+            size = 0
+        size += obj_size
+    if start < len(objects):
+        ranges.append((start, len(objects)))
+    return ranges
+
+
+def returned_ids(result) -> list:
+    """IDs from a create/update/delete/massupdate result, e.g. {"hostids": ["1", "2"]} -> ["1", "2"]"""
+    if isinstance(result, dict):
+        for key, value in result.items():
+            if key.endswith('ids') and isinstance(value, list):
+                return value
+    return []
+
+
+def bulk(zabbix_api,
+         method: str,
+         objects: list,
+         chunk_size: int = 500,
+         max_bytes: int = 1024 * 1024,
+         workers: int = 4,
+         retries: int = 0,
+         key: str = None,
+         common: dict = None) -> BulkResult:
+    """Send objects in chunks to method via a pool of workers (see ZabbixAPI.bulk)
+
+    Arguments:
+        zabbix_api {ZabbixAPI} -- Logged in ZabbixAPI to send with
+        method {str} -- Zabbix API method (e.g. 'host.create', 'item.update', 'host.delete', 'host.massupdate')
+        objects {list} -- Objects (or IDs for delete) to send
+        chunk_size {int} -- Most objects per request (default: 500)
+        max_bytes {int} -- Most JSON bytes of objects per request (default: 1MB)
+        workers {int} -- Requests in flight at once (default: 4)
+        retries {int} -- Times to retry failed chunks, after all chunks have been tried once (default: 0)
+        key {str} -- Send params as {key: chunk, **common} rather than chunk, e.g. 'hosts' for
+                     'host.massupdate' (default: None)
+        common {dict} -- Parameters sent with every chunk when key is set, e.g. {'status': 1} (default: None)
+
+    Returns:
+        result {BulkResult} -- IDs returned in input order and any failed chunks
+    """
+    objects = list(objects)
+    result = BulkResult(len(objects))
+
+    def send(chunk_range):
+        start, end = chunk_range
+        chunk = objects[start:end]
+        params = dict(common or {}, **{key: chunk}) if key else chunk
+        try:
+            ids = returned_ids(zabbix_api.do_request(method, params)['result'])
+        except Exception as ex:
+            logger.warning(f"bulk(): {method} of objects[{start}:{end}] failed: {ex}")
+            return chunk_range, ex
+        if len(ids) != end - start:
+            logger.warning(f"bulk(): {method} of objects[{start}:{end}] returned {len(ids)} IDs")
+        result.IDS[start:start + len(ids[:end - start])] = ids[:end - start]
+        return chunk_range, None
+
+    pending = chunk_ranges(objects, chunk_size, max_bytes)
+    logger.debug(f"bulk(): {method} of {len(objects)} objects in {len(pending)} chunks")
+    failed = []
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for attempt in range(retries + 1):
+            failed = [(chunk_range, error) for chunk_range, error in executor.map(send, pending) if error]
+            if not failed:
+                break
+            pending = [chunk_range for chunk_range, _ in failed]
+            if attempt < retries:
+                logger.info(f"bulk(): Retrying {len(pending)} failed chunks of {method}")
+
+    result.ERRORS = [BulkError(start, end, error, retries + 1) for (start, end), error in failed]
+    return result
@@ -0,0 +1,228 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Compact
+    Contains conversion of large *.get results from dicts of strings into compact records,
+    including decoding responses straight into records so the rows are never all held as dicts
+"""
+
+import re
+import json
+import logging
+from array import array
+from collections import namedtuple
+
+logger = logging.getLogger(__name__)
+
+# Zabbix object ID fields, listed explicitly as not every field ending 'id' is an ID (e.g. uuid)
+ID_FIELDS = frozenset((
+    'acknowledgeid', 'actionid', 'alertid', 'applicationid', 'c_eventid', 'correlationid', 'dashboardid',
+    'dcheckid', 'dhostid', 'discoveryid', 'druleid', 'dserviceid', 'eventid', 'functionid', 'gitemid',
+    'graphid', 'groupid', 'hostid', 'hostmacroid', 'globalmacroid', 'httpstepid', 'httptestid', 'iconmapid',
+    'imageid', 'interfaceid', 'itemid', 'maintenanceid', 'master_itemid', 'mediaid', 'mediatypeid', 'objectid',
+    'operationid', 'parent_itemid', 'proxy_hostid', 'proxyid', 'r_eventid', 'regexpid', 'roleid', 'scriptid',
+    'screenid', 'screenitemid', 'selementid', 'serviceid', 'slaid', 'sysmapid', 'taskid', 'templateid',
+    'tokenid', 'triggerid', 'userid', 'usrgrpid', 'valuemapid', 'widgetid',
+))
+
+# Other fields holding integers
+INT_FIELDS = ('clock', 'ns', 'lastclock', 'lastns')
+
+_RECORD_TYPES = {}
+
+_WHITESPACE = re.compile(r'[ \t\n\r]*')
+_DECODER = json.JSONDecoder()
+
+
+def record_type(fields: tuple):
+    """Record class for fields, a namedtuple so instances have no per instance dict
+
+    Arguments:
+        fields {tuple(str)} -- Field names, e.g. ('itemid', 'name')
+
+    Returns:
+        record_type {type} -- namedtuple class, shared between calls with the same fields
+    """
+    fields = tuple(fields)
+    if fields not in _RECORD_TYPES:
+        # rename=True replaces any field names that are not valid identifiers with _<index>
+        _RECORD_TYPES[fields] = namedtuple('Record', fields, rename=True)
+    return _RECORD_TYPES[fields]
+
+
+def is_int_field(field: str) -> bool:
+    """Whether field holds integers, i.e. IDs (e.g. 'itemid') or times (e.g. 'clock')"""
+    return field in ID_FIELDS or field in INT_FIELDS
+
+
+class RecordBuilder(object):
+    """Converts rows of a *.get result into records one at a time
+
+        Records are namedtuples of output plus any other keys of the rows (in order first seen), as Zabbix
+        adds fields not in output (e.g. the object's ID) and rows may have different keys. Missing fields are
+        None. Integer strings in int_fields are converted to int and other equal strings share one object.
+        Nested values (e.g. selectHosts) are left as is. Call finish() once all rows have been converted.
+    """
+
+    def __init__(self, int_fields: tuple = None, output: list = None):
+        """Initialise the builder
+
+        Arguments:
+            int_fields {tuple(str)} -- Fields to convert to int (default: None - ID_FIELDS and INT_FIELDS)
+            output {list} -- Fields requested, so they lead each record (default: None - keys of the rows)
+        """
+        self.INT_FIELDS = int_fields
+        self.OUTPUT = tuple(output) if isinstance(output, (list, tuple)) else ()
+        self.FIELDS = {}  # field: index in record
+        self.KEYS = ()  # FIELDS in order
+        self.IS_INT = []
+        self.STRINGS = {}
+        self.RECORD = None
+        self.GREW = False  # Whether fields were added after records were made
+        self.COUNT = 0
+        self._add_fields(self.OUTPUT)
+
+    def _add_fields(self, fields):
+        for field in fields:
+            if field not in self.FIELDS:
+                self.FIELDS[field] = len(self.FIELDS)
+                self.IS_INT.append(field in self.INT_FIELDS if self.INT_FIELDS is not None else is_int_field(field))
+        self.GREW = self.GREW or self.COUNT > 0
+        self.KEYS = tuple(self.FIELDS)
+        self.RECORD = record_type(self.KEYS)
+
+    def record(self, row: dict):
+        """Record of row (a dict of one *.get result)"""
+        if tuple(row) == self.KEYS:  # Usually every row has the same keys in the same order
+            values = list(row.values())
+        else:
+            if self.RECORD is None or not row.keys() <= self.FIELDS.keys():
+                self._add_fields(row)
+            values = [row.get(field) for field in self.KEYS]
+        is_int, strings = self.IS_INT, self.STRINGS
+        for index, raw in enumerate(values):
+            if raw.__class__ is str:
+                values[index] = int(raw) if is_int[index] and raw.isdigit() else strings.setdefault(raw, raw)
+        self.COUNT += 1
+        return self.RECORD._make(values)
+
+    def finish(self, records: list) -> list:
+        """Widen records made before the last field was seen to all fields, in place
+
+        Arguments:
+            records {list(Record)} -- Records returned by record()
+
+        Returns:
+            records {list(Record)} -- records, now all of one Record type
+        """
+        if self.GREW:
+            Record = self.RECORD
+            for index, record in enumerate(records):
+                if isinstance(record, tuple) and type(record) is not Record:
+                    records[index] = Record._make(record + (None, ) * (len(Record._fields) - len(record)))
+        if self.OUTPUT and len(self.FIELDS) > len(self.OUTPUT):
+            logger.debug(f"RecordBuilder: Rows have fields {tuple(self.FIELDS)[len(self.OUTPUT):]} not in output")
+        logger.debug(f"RecordBuilder: {self.COUNT} records of {tuple(self.FIELDS)}, "
+                     f"{len(self.STRINGS)} distinct strings")
+        return records
+
+
+def compact_records(rows: list, int_fields: tuple = None, output: list = None) -> list:
+    """Convert rows of a *.get result into records in place, freeing each dict as it is converted, e.g.
+        {'itemid': '10', 'name': 'CPU'} -> Record(itemid=10, name='CPU') (see RecordBuilder).
+        Rows that are not dicts (e.g. countOutput) are returned unchanged.
+
+    Arguments:
+        rows {list(dict)} -- Result of *.get
+        int_fields {tuple(str)} -- Fields to convert to int (default: None - ID_FIELDS and INT_FIELDS)
+        output {list} -- Fields requested, so they lead each record (default: None - keys of the rows)
+
+    Returns:
+        records {list(Record)} -- rows, now holding records
+    """
+    if not isinstance(rows, list) or not rows or not isinstance(rows[0], dict):
+        return rows
+
+    builder = RecordBuilder(int_fields, output)
+    for index, row in enumerate(rows):
+        rows[index] = builder.record(row)
+    return builder.finish(rows)
+
+
+def decode_response(content, int_fields: tuple = None, output: list = None) -> dict:
+    """Decode a JSON-RPC response, converting each row of a list result into a record as soon as it is
+        decoded, so (unlike compact_records after json.loads) the rows are never all held as dicts at once
+
+    Arguments:
+        content {bytes|str} -- JSON response body
+        int_fields {tuple(str)} -- Fields to convert to int (default: None - ID_FIELDS and INT_FIELDS)
+        output {list} -- Fields requested, so they lead each record (default: None - keys of the rows)
+
+    Returns:
+        response {dict} -- The response, with a list result holding records
+    """
+    text = content.decode('utf-8') if isinstance(content, bytes) else content
+    index = _skip(text, 0)
+    if text[index:index + 1] != '{':
+        return json.loads(text)
+
+    response = {}
+    index = _skip(text, index + 1)
+    while text[index:index + 1] != '}':
+        if response:
+            index = _expect(text, index, ',')
+        key, index = _DECODER.raw_decode(text, index)
+        if not isinstance(key, str):
+            raise ValueError(f"Expecting property name at {index}")
+        index = _expect(text, _skip(text, index), ':')
+        if key == 'result' and text[index:index + 1] == '[':
+            response[key], index = _decode_records(text, index, RecordBuilder(int_fields, output))
+        else:
+            response[key], index = _DECODER.raw_decode(text, index)
+        index = _skip(text, index)
+    if _skip(text, index + 1) != len(text):
+        raise ValueError(f"Extra data at {index + 1}")
+    return response
+
+
+def _decode_records(text: str, index: int, builder: RecordBuilder) -> (list, int):
+    """Records of the JSON array starting at index, and the index after it"""
+    records = []
+    scan, record = _DECODER.scan_once, builder.record
+    index = _skip(text, index + 1)
+    if text[index:index + 1] == ']':
+        return records, index + 1
+    while True:
+        try:
+            row, index = scan(text, index)
+        except StopIteration as ex:
+            raise json.JSONDecodeError("Expecting value", text, ex.value) from None
+        records.append(record(row) if isinstance(row, dict) else row)
+        if text[index:index + 1] != ',':  # Separators are rarely padded, so only skip whitespace if needed
+            index = _skip(text, index)
+            if text[index:index + 1] == ']':
+                return builder.finish(records), index + 1
+        index = _expect(text, index, ',')
+
+
+def _skip(text: str, index: int) -> int:
+    return _WHITESPACE.match(text, index).end()
+
+
+def _expect(text: str, index: int, char: str) -> int:
+    if text[index:index + 1] != char:
+        raise ValueError(f"Expecting '{char}' at {index}")
+    return _skip(text, index + 1)
+
+
+def column(records: list, field: str, typecode: str = 'q') -> array:
+    """Values of an integer field of records as an array, e.g. column(items, 'itemid')
+
+    Arguments:
+        records {list(Record)} -- Result of compact_records
+        field {str} -- Integer field to take
+        typecode {str} -- array typecode (default: q - signed 64 bit)
+
+    Returns:
+        values {array} -- Values of field, 8 bytes each rather than an int object each
+    """
+    return array(typecode, (getattr(record, field) for record in records))
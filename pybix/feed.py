@@ -0,0 +1,168 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Feed
+    Contains an incremental change feed that follows new events/problems using watermarks
+    rather than re-downloading overlapping time windows
+"""
+
+import os
+import json
+import time
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Per object: ID field used as watermark, the '*_from' parameter filtering by it and the default minimal output
+FEEDS = {
+    'event': {
+        'id': 'eventid',
+        'id_from': 'eventid_from',
+        'output': ['eventid', 'source', 'object', 'objectid', 'clock', 'ns', 'value', 'severity', 'name'],
+    },
+    'problem': {
+        'id': 'eventid',
+        'id_from': 'eventid_from',
+        'output': ['eventid', 'source', 'object', 'objectid', 'clock', 'ns', 'severity', 'name'],
+    },
+}
+
+
+class ChangeFeed(object):
+    """Iterates over new records of event.get/problem.get as they occur, e.g.
+
+        for event in ZAPI.follow('event', params={'source': 0, 'value': 1}, checkpoint='events.json'):
+            print(event['name'])
+
+        Each poll only asks for records after the last eventid seen, ordered by eventid. Late data (e.g. from
+        proxies) still creates events with higher eventids, so is delivered even if its clock is older.
+        Polling backs off from interval to max_interval while there are no new records.
+        If checkpoint is set, the position is saved there after each batch has been consumed, so a
+        restarted feed resumes where it left off (a batch interrupted part way is delivered again).
+    """
+
+    def __init__(self,
+                 zabbix_api,
+                 object_name: str = 'event',
+                 params: dict = None,
+                 output: list = None,
+                 checkpoint: str = None,
+                 since: int = None,
+                 interval: float = 5,
+                 max_interval: float = 300,
+                 limit: int = 1000):
+        """Initialise the feed (but not poll)
+
+        Arguments:
+            zabbix_api {ZabbixAPI} -- Logged in ZabbixAPI to poll with
+            object_name {str} -- Zabbix API object to follow, 'event' or 'problem' (default: event)
+            params {dict} -- Additional parameters to *.get, e.g. {'source': 0, 'severities': [4, 5]} (default: None)
+            output {list} -- Fields to return (default: None - minimal fields in FEEDS)
+            checkpoint {str} -- Path to file to save/resume position from (default: None - don't save position)
+            since {int} -- Unix time to start from if there is no checkpoint (default: None - now)
+            interval {float} -- Seconds between polls while records are arriving (default: 5)
+            max_interval {float} -- Most seconds between polls while idle (default: 300)
+            limit {int} -- Most records per poll, if reached the next poll is immediate (default: 1000)
+        """
+        if object_name not in FEEDS:
+            raise ValueError(f"Invalid object_name. Expecting {tuple(FEEDS)}")
+
+        self.ZAPI = zabbix_api
+        self.OBJECT = object_name
+        self.FEED = FEEDS[object_name]
+        self.PARAMS = params or {}
+        self.OUTPUT = output or self.FEED['output']
+        if isinstance(self.OUTPUT, list):
+            # Watermarks need the ID and clock of every record
+            self.OUTPUT = self.OUTPUT + [field for field in (self.FEED['id'], 'clock') if field not in self.OUTPUT]
+        self.CHECKPOINT = checkpoint
+        self.MIN_INTERVAL = interval
+        self.MAX_INTERVAL = max_interval
+        self.INTERVAL = interval
+        self.LIMIT = limit
+        self.FULL = False
+
+        self.LAST_ID = None
+        self.LAST_CLOCK = int(since if since is not None else time.time())
+        self._load_checkpoint()
+
+    def __iter__(self):
+        while True:
+            records = self.poll()
+            for record in records:
+                yield record
+            if records:
+                self.save_checkpoint()
+            delay = self._next_interval(records)
+            if delay:
+                time.sleep(delay)
+
+    def __aiter__(self):
+        return self._follow_async()
+
+    async def _follow_async(self):
+        loop = asyncio.get_event_loop()
+        while True:
+            records = await loop.run_in_executor(None, self.poll)
+            for record in records:
+                yield record
+            if records:
+                self.save_checkpoint()
+            delay = self._next_interval(records)
+            if delay:
+                await asyncio.sleep(delay)
+
+    def poll(self) -> list:
+        """Get records newer than the current position and advance position past them
+
+        Returns:
+            records {list(dict)} -- New records ordered by ID
+        """
+        id_field = self.FEED['id']
+        params = dict(self.PARAMS,
+                      output=self.OUTPUT,
+                      sortfield=id_field,
+                      sortorder='ASC',
+                      limit=self.LIMIT)
+        if self.LAST_ID is None:
+            params['time_from'] = self.LAST_CLOCK
+        else:
+            params[self.FEED['id_from']] = str(self.LAST_ID + 1)
+        records = getattr(self.ZAPI, self.OBJECT).get(**params)
+
+        self.FULL = len(records) >= self.LIMIT
+        if records:
+            self.LAST_ID = max(self.LAST_ID or 0, max(int(record[id_field]) for record in records))
+            self.LAST_CLOCK = max(self.LAST_CLOCK, max(int(record['clock']) for record in records))
+        logger.debug(f"ChangeFeed.poll(): {len(records)} new {self.OBJECT} records, last {id_field} {self.LAST_ID}")
+        return records
+
+    def _next_interval(self, records: list) -> float:
+        """Seconds to wait before next poll, backing off while idle"""
+        if records and self.FULL:
+            return 0
+        if records:
+            self.INTERVAL = self.MIN_INTERVAL
+        else:
+            self.INTERVAL = min(self.INTERVAL * 2, self.MAX_INTERVAL)
+        return self.INTERVAL
+
+    def _load_checkpoint(self):
+        if not self.CHECKPOINT or not os.path.exists(self.CHECKPOINT):
+            return
+        with open(self.CHECKPOINT) as f:
+            checkpoint = json.load(f)
+        if checkpoint.get('object') != self.OBJECT:
+            raise ValueError(f"Checkpoint {self.CHECKPOINT} is for {checkpoint.get('object')}, not {self.OBJECT}")
+        self.LAST_ID = checkpoint['last_id']
+        self.LAST_CLOCK = checkpoint['last_clock']
+        logger.debug(f"ChangeFeed: Resuming from {self.CHECKPOINT} at {self.FEED['id']} {self.LAST_ID}")
+
+    def save_checkpoint(self):
+        """Save current position to checkpoint file (if set)"""
+        if not self.CHECKPOINT:
+            return
+        temp = f"{self.CHECKPOINT}.tmp"
+        with open(temp, 'w') as f:
+            json.dump({'object': self.OBJECT, 'last_id': self.LAST_ID, 'last_clock': self.LAST_CLOCK}, f)
+        os.replace(temp, self.CHECKPOINT)
@@ -8,58 +8,199 @@ import urllib3
 import requests
 import os
 import logging
+import threading
+import time
 from datetime import datetime
 from requests import Response
 from pathlib import PurePath
+from urllib.parse import urlparse
 from pybix.api import ZabbixAPI
+from pybix.metrics import EventHooks, RequestEvent
+from pybix.limiter import AdaptiveLimiter, throttle
+from pybix.balancer import frontend_pool
 
 logger = logging.getLogger(__name__)
 
+# Frontend session cookie names (zbx_sessionid prior to Zabbix 5.2)
+FRONTEND_COOKIES = ('zbx_session', 'zbx_sessionid')
 
-class GraphImage(object):
+
+class GraphImage(EventHooks):
     """Class that handles getting/saving Zabbix Graph Images directly
         Note: This is not a Zabbix API object
     """
 
     def __init__(self,
-                 url: str = None,
+                 url=None,
                  username: str = None,
                  password: str = None,
-                 ssl_verify: bool = True):
-        """Initialise the GraphImage session (including login)
+                 ssl_verify: bool = True,
+                 session: requests.Session = None,
+                 limiter: AdaptiveLimiter = None):
+        """Initialise the GraphImage session (login is deferred until the first image is requested)
 
         Arguments:
-            url {str} -- Base URL to Zabbix (default: ZABBIX_SERVER environment variable or
-                                                    https://localhost/zabbix)
+            url {str|list|FrontendPool} -- Base URL to Zabbix, or URLs (list or comma separated) of frontends
+                                           to balance image requests across, logging in to each
+                                           (default: ZABBIX_SERVER environment variable or https://localhost/zabbix)
             username {str} -- Zabbix Username (default: ZABBIX_USER environment variable or 'Admin')
             password {str} -- Zabbix Password (default: ZABBIX_PASSWORD environment variable or 'zabbix')
             ssl_verify {bool} -- Whether to attempt SSL verification during call (default: True)
+            session {requests.Session} -- Existing session to share connection pool with, e.g. ZabbixAPI
+                                          (default: None - create new session)
+            limiter {AdaptiveLimiter} -- Limiter to throttle image requests with, e.g.
+                                         AdaptiveLimiter.for_server(url) (default: None - no throttling)
         """
         url = url or os.environ.get(
             'ZABBIX_SERVER') or 'http://localhost/zabbix'
+        self.POOL = frontend_pool(url)
+        if self.POOL is not None:
+            url = self.POOL.URLS[0]
+        elif not isinstance(url, str):
+            url = url[0]
         self.BASE_URL = url.replace(
             "/api_jsonrpc.php",
             "") if not url.endswith('/api_jsonrpc.php') else url
 
-        payload = {
+        self.PAYLOAD = {
             'name': username or os.environ.get('ZABBIX_USER') or 'Admin',
             'password': password or os.environ.get('ZABBIX_PASSWORD')
             or 'zabbix',  # noqa: W503
             'enter': 'Sign in'
         }
-        self.SESSION = requests.Session()
+        self.SESSION = session or requests.Session()
         self.SSL_VERIFY = ssl_verify
+        self.LIMITER = limiter
+        self.LOGIN_LOCK = threading.Lock()
+        self.HOOKS = []
 
-        # Perform Login (note: not via Zabbix API since it doesn't
-        #   expose graph exports, only configuration)
-        logger.debug(
-            f"GraphImage: Attempting to login to Zabbix server at {self.BASE_URL}/index.php"
-        )
         if not self.SSL_VERIFY:
             urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
-        self.SESSION.post(f"{self.BASE_URL}/index.php",
-                          data=payload,
+
+    def _login(self, base_url: str = None):
+        """Login to the Zabbix frontend (note: not via Zabbix API since it doesn't
+            expose graph exports, only configuration)
+
+        Arguments:
+            base_url {str} -- Frontend to login to, as cookies are per host (default: None - BASE_URL)
+        """
+        base_url = base_url or self.BASE_URL
+        logger.debug(
+            f"GraphImage: Attempting to login to Zabbix server at {base_url}/index.php"
+        )
+        self.SESSION.post(f"{base_url}/index.php",
+                          data=self.PAYLOAD,
                           verify=self.SSL_VERIFY)
+        if not self._is_logged_in(base_url):
+            logger.warning(
+                f"GraphImage: No frontend session cookie after login to {base_url}/index.php")
+
+    @property
+    def is_logged_in(self) -> bool:
+        """Whether the session holds an unexpired frontend session cookie for BASE_URL
+
+        Returns:
+            is_logged_in {bool} -- Whether logged in to the frontend or not
+        """
+        return self._is_logged_in(self.BASE_URL)
+
+    def _is_logged_in(self, base_url: str) -> bool:
+        host = urlparse(base_url).hostname or ''
+        for cookie in self.SESSION.cookies:
+            if cookie.name in FRONTEND_COOKIES and not cookie.is_expired() \
+                    and cookie.domain.lstrip('.') in (host, f"{host}.local"):
+                return True
+        return False
+
+    def _get_image(self, base_url: str, path: str) -> (Response, int):
+        """Get image from frontend, logging in first if there is no valid frontend session cookie
+            and logging in again if the frontend responds with a page rather than an image
+            (i.e. the session has been expired server side)
+
+        Arguments:
+            base_url {str} -- Frontend to get image from
+            path {str} -- Path of chart.php/chart2.php with query string
+
+        Returns:
+            image {Response} -- Streamed response of the image
+            retries {int} -- Number of times the image was requested again after logging in
+        """
+        with self.LOGIN_LOCK:
+            if not self._is_logged_in(base_url):
+                self._login(base_url)
+
+        url = f"{base_url}/{path}"
+        image = self.SESSION.get(url, stream=True, verify=self.SSL_VERIFY)
+        if image.headers.get('Content-Type', '').startswith('text/html'):
+            logger.debug("GraphImage: Received page instead of image, logging in again")
+            image.close()
+            with self.LOGIN_LOCK:
+                self._login(base_url)
+            return self.SESSION.get(url, stream=True, verify=self.SSL_VERIFY), 1
+        return image, 0
+
+    def _fetch_image(self, path: str) -> (Response, int):
+        """_get_image from BASE_URL, or from a frontend of POOL (hedging if slow)"""
+        if self.POOL is None:
+            return self._get_image(self.BASE_URL, path)
+
+        def fetch(base_url: str) -> (Response, int):
+            image, retries = self._get_image(base_url, path)
+            # Read image here so the frontend's latency includes it and a losing hedged request frees its connection
+            image.content
+            image.raise_for_status()  # So POOL sees failures
+            return image, retries
+
+        return self.POOL.call(fetch, hedge=True, method=path.split('?')[0])
+
+    def _export(self,
+                chart: str,
+                path: str,
+                graph_details: str,
+                output_path: str = None) -> str:
+        """Get image from frontend and save to file, emitting a RequestEvent to any hooks
+
+        Arguments:
+            chart {str} -- Frontend chart script the image is from (e.g. 'chart2')
+            path {str} -- Path of chart.php/chart2.php with query string
+            graph_details {str} -- Either Zabbix Graph or Item ID
+            output_path {str} -- Path to save to (default: os.getcwd())
+
+        Returns:
+            file_name {str} -- The name of the saved graph image
+        """
+        timings = {}
+        status = None
+        error = None
+        retries = 0
+        response_wire_bytes = 0
+        file_name = ""
+        url = f"{self.BASE_URL}/{path}"
+        start = time.perf_counter()
+        try:
+            with throttle(self.LIMITER, timings):
+                image, retries = self._fetch_image(path)
+                with image:
+                    url = image.url
+                    status = image.status_code
+                    timings['wait'] = image.elapsed.total_seconds()
+                    image.raise_for_status()  # Rather than save error page as image
+                    downloading = time.perf_counter()
+                    file_name = self._save(image, graph_details, output_path)
+                    timings['download'] = time.perf_counter() - downloading
+                    response_wire_bytes = image.raw.tell()
+        except Exception as ex:
+            error = ex
+            status = status or getattr(getattr(ex, 'response', None), 'status_code', None)
+            raise
+        finally:
+            if self.HOOKS:
+                timings['total'] = time.perf_counter() - start
+                self._emit(RequestEvent(f"graphimage.{chart}", url, status, error, 0,
+                                        os.path.getsize(file_name) if file_name else 0,
+                                        timings, retries, False, 0, response_wire_bytes))
+
+        return file_name
 
     def _get_by_graph_id(self,
                          graph_id: str,
@@ -83,15 +224,12 @@ class GraphImage(object):
         """
         # TODO provide some input validation
 
-        with self.SESSION.get(
-                f"{self.BASE_URL}/chart2.php?graphid={graph_id}&from={from_date}&to={to_date}"
-                f"&profileIdx=web.graphs.filter&width={width}&height={height}",
-                stream=True) as image:
-            file_name = self._save(
-                image, f"graph-{graph_id}",
-                output_path)
-
-        return file_name
+        return self._export(
+            "chart2",
+            f"chart2.php?graphid={graph_id}&from={from_date}&to={to_date}"
+            f"&profileIdx=web.graphs.filter&width={width}&height={height}",
+            f"graph-{graph_id}",
+            output_path)
 
     def _get_by_item_ids(self,
                          item_ids: list,
@@ -123,17 +261,12 @@ class GraphImage(object):
             [f"itemids%5B{item_id}%5D={item_id}" for item_id in item_ids])
         formatted_itemids = "-".join(item_ids)
 
-        with self.SESSION.get(
-                f"{self.BASE_URL}/chart.php?from={from_date}&to={to_date}&{encoded_itemids}"
-                f"&type={graph_type}&batch={batch}&profileIdx=web.graphs.filter&width={width}&height={height}"
-                f"",
-                stream=True) as image:
-            file_name = self._save(
-                image,
-                f"items-{formatted_itemids}-from-{from_date}-to-{to_date}",
-                output_path)
-
-        return file_name
+        return self._export(
+            "chart",
+            f"chart.php?from={from_date}&to={to_date}&{encoded_itemids}"
+            f"&type={graph_type}&batch={batch}&profileIdx=web.graphs.filter&width={width}&height={height}",
+            f"items-{formatted_itemids}-from-{from_date}-to-{to_date}",
+            output_path)
 
     def _save(self,
               image: Response,
@@ -173,23 +306,35 @@ class GraphImageAPI(GraphImage):
     """Helper class for easier Zabbix Graph Image calls"""
 
     def __init__(self,
-                 url: str = None,
+                 url=None,
                  user: str = None,
                  password: str = None,
                  output_path: str = None,
-                 ssl_verify: bool = True):
-        """Initialise the GraphImage session (including login)
+                 ssl_verify: bool = True,
+                 limiter: AdaptiveLimiter = None,
+                 coalesce: bool = False):
+        """Initialise the GraphImage and ZabbixAPI sessions, sharing a single connection pool
+            (ZabbixAPI login is immediate, frontend login is on first image requested)
 
         Arguments:
-            url {str} -- Base URL to Zabbix (default: ZABBIX_SERVER environment variable or
-                                             https://localhost/zabbix)
+            url {str|list|FrontendPool} -- Base URL to Zabbix, or URLs (list or comma separated) of frontends
+                                           sharing one database to balance API and image requests across
+                                           (default: ZABBIX_SERVER environment variable or https://localhost/zabbix)
             username {str} -- Zabbix Username (default: ZABBIX_USER environment variable or 'Admin')
             password {str} -- Zabbix Password (default: ZABBIX_PASSWORD environment variable or 'zabbix')
             output_path {str} -- Path of directory to save to (default: os.getcwd())
             ssl_verify {bool} -- Whether to attempt SSL verification during call (default: True)
+            limiter {AdaptiveLimiter} -- Limiter shared by API and image requests, e.g.
+                                         AdaptiveLimiter.for_server(url) (default: None - no throttling)
+            coalesce {bool} -- Whether identical concurrent API lookups share one request (default: False)
         """
-        super().__init__(url, user, password, ssl_verify=ssl_verify)
-        self.ZAPI = ZabbixAPI(url, ssl_verify=ssl_verify)
+        super().__init__(url, user, password, ssl_verify=ssl_verify, limiter=limiter)
+        self.ZAPI = ZabbixAPI(self.POOL or self.BASE_URL,
+                              ssl_verify=ssl_verify,
+                              session=self.SESSION,
+                              limiter=limiter,
+                              coalesce=coalesce)
+        self.ZAPI.HOOKS = self.HOOKS  # So hooks added to either see both API and image requests
         self.ZAPI.login(user, password)
         self.OUTPUT_PATH = output_path
 
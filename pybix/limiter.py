@@ -0,0 +1,213 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Limiter
+    Contains client side rate limiting and adaptive (AIMD) concurrency limiting so parallel
+    API calls/graph exports back off before saturating the Zabbix frontend
+"""
+
+import time
+import logging
+import threading
+import requests
+from contextlib import contextmanager
+from urllib.parse import urlparse
+
+logger = logging.getLogger(__name__)
+
+# HTTP statuses that indicate the frontend (e.g. PHP-FPM workers) is overloaded
+OVERLOAD_STATUSES = (429, 500, 502, 503, 504)
+
+
+class TokenBucket(object):
+    """Thread safe token bucket allowing rate requests per second with bursts of up to burst requests"""
+
+    def __init__(self, rate: float, burst: int = None):
+        """Initialise the (full) token bucket
+
+        Arguments:
+            rate {float} -- Tokens (requests) added per second
+            burst {int} -- Maximum tokens held (default: None - same as rate, minimum 1)
+        """
+        self.RATE = float(rate)
+        self.BURST = float(burst or max(rate, 1))
+        self.TOKENS = self.BURST
+        self.UPDATED = time.monotonic()
+        self.LOCK = threading.Lock()
+
+    def acquire(self) -> float:
+        """Take a token, sleeping until one is available
+
+        Returns:
+            waited {float} -- Seconds slept waiting for a token
+        """
+        with self.LOCK:
+            now = time.monotonic()
+            self.TOKENS = min(self.BURST, self.TOKENS + (now - self.UPDATED) * self.RATE)
+            self.UPDATED = now
+            # Reserve token even if not yet available so waiters are served in order
+            self.TOKENS -= 1
+            waited = -self.TOKENS / self.RATE if self.TOKENS < 0 else 0.0
+        if waited:
+            time.sleep(waited)
+        return waited
+
+
+class AdaptiveLimiter(object):
+    """Limits requests in flight using AIMD (additive increase, multiplicative decrease)
+        The limit grows by ~1 per round trip while requests succeed and is cut by backoff
+        when requests fail due to overload (5xx, 429, timeouts, connection errors) or are slow
+        An optional token bucket also caps requests per second
+
+        e.g. (shared by all clients of the same server)
+            LIMITER = AdaptiveLimiter.for_server("http://localhost/zabbix", rate=50)
+            ZAPI = ZabbixAPI("http://localhost/zabbix", limiter=LIMITER)
+    """
+    LIMITERS = {}
+    LIMITERS_LOCK = threading.Lock()
+
+    def __init__(self,
+                 initial_limit: int = 4,
+                 min_limit: int = 1,
+                 max_limit: int = 64,
+                 rate: float = None,
+                 burst: int = None,
+                 latency_target: float = None,
+                 tolerance: float = 4.0,
+                 backoff: float = 0.5):
+        """Initialise the limiter
+
+        Arguments:
+            initial_limit {int} -- Requests allowed in flight to start with (default: 4)
+            min_limit {int} -- Lowest the limit will be cut to (default: 1)
+            max_limit {int} -- Highest the limit will grow to (default: 64)
+            rate {float} -- Maximum requests per second (default: None - no rate limit)
+            burst {int} -- Requests allowed in a burst above rate (default: None - same as rate)
+            latency_target {float} -- Seconds above which a request counts as overloaded
+                                      (default: None - tolerance times the average latency)
+            tolerance {float} -- Multiple of average latency above which a request counts as overloaded
+                                 if latency_target not set (default: 4.0)
+            backoff {float} -- Multiplier applied to limit on overload (default: 0.5)
+        """
+        self.LIMIT = float(initial_limit)
+        self.MIN_LIMIT = min_limit
+        self.MAX_LIMIT = max_limit
+        self.BUCKET = TokenBucket(rate, burst) if rate else None
+        self.LATENCY_TARGET = latency_target
+        self.TOLERANCE = tolerance
+        self.BACKOFF = backoff
+
+        self.IN_FLIGHT = 0
+        self.AVERAGE_LATENCY = None
+        self.LAST_DECREASE = 0.0
+        self.CONDITION = threading.Condition()
+
+    @classmethod
+    def for_server(cls, url: str, **kwargs):
+        """Get the limiter shared by all requests to url's server, creating it with kwargs if needed
+
+        Arguments:
+            url {str} -- Any URL on the Zabbix server (only scheme and host:port are used)
+            kwargs {dict} -- Arguments to AdaptiveLimiter if it is created
+
+        Returns:
+            limiter {AdaptiveLimiter} -- The server's limiter
+        """
+        parsed = urlparse(url)
+        key = f"{parsed.scheme}://{parsed.netloc}"
+        with cls.LIMITERS_LOCK:
+            if key not in cls.LIMITERS:
+                cls.LIMITERS[key] = cls(**kwargs)
+            return cls.LIMITERS[key]
+
+    def acquire(self) -> float:
+        """Wait for a token (if rate limited) and a free slot under the current limit
+
+        Returns:
+            waited {float} -- Seconds spent waiting
+        """
+        start = time.perf_counter()
+        if self.BUCKET:
+            self.BUCKET.acquire()
+        with self.CONDITION:
+            while self.IN_FLIGHT >= int(self.LIMIT):
+                self.CONDITION.wait()
+            self.IN_FLIGHT += 1
+        return time.perf_counter() - start
+
+    def release(self, latency: float, overloaded: bool = False):
+        """Free slot taken by acquire and adjust the limit based on the outcome of the request
+
+        Arguments:
+            latency {float} -- Seconds the request took
+            overloaded {bool} -- Whether the request failed due to overload (default: False)
+        """
+        with self.CONDITION:
+            self.IN_FLIGHT -= 1
+
+            target = self.LATENCY_TARGET
+            if target is None and self.AVERAGE_LATENCY is not None:
+                target = self.AVERAGE_LATENCY * self.TOLERANCE
+            self.AVERAGE_LATENCY = latency if self.AVERAGE_LATENCY is None \
+                else self.AVERAGE_LATENCY * 0.95 + latency * 0.05
+
+            now = time.monotonic()
+            if overloaded or (target is not None and latency > target):
+                # Requests already in flight when overload started will also report it, so only
+                # decrease once per round trip
+                if now - self.LAST_DECREASE >= self.AVERAGE_LATENCY:
+                    self.LIMIT = max(self.LIMIT * self.BACKOFF, self.MIN_LIMIT)
+                    self.LAST_DECREASE = now
+                    logger.debug(f"AdaptiveLimiter: Overloaded (latency {latency:.3f}s), limit now {self.LIMIT:.1f}")
+            else:
+                self.LIMIT = min(self.LIMIT + 1 / self.LIMIT, self.MAX_LIMIT)
+            self.CONDITION.notify_all()
+
+    @contextmanager
+    def slot(self, timings: dict = None):
+        """Context manager holding a slot for the duration of a request, recording the outcome
+
+        Arguments:
+            timings {dict} -- If provided, seconds waited are stored as timings['throttle'] (default: None)
+        """
+        waited = self.acquire()
+        if timings is not None:
+            timings['throttle'] = waited
+
+        start = time.perf_counter()
+        overloaded = False
+        try:
+            yield
+        except Exception as ex:
+            overloaded = is_overload(ex)
+            raise
+        finally:
+            self.release(time.perf_counter() - start, overloaded)
+
+
+def is_overload(ex: Exception) -> bool:
+    """Whether exception indicates the server is overloaded (rather than e.g. invalid parameters)
+
+    Arguments:
+        ex {Exception} -- Exception raised by request
+
+    Returns:
+        is_overload {bool} -- Whether exception is due to overload
+    """
+    if isinstance(ex, requests.HTTPError):
+        return ex.response is not None and ex.response.status_code in OVERLOAD_STATUSES
+    return isinstance(ex, (requests.Timeout, requests.ConnectionError))
+
+
+@contextmanager
+def throttle(limiter: AdaptiveLimiter = None, timings: dict = None):
+    """AdaptiveLimiter.slot() if limiter is set, otherwise does nothing
+
+    Arguments:
+        limiter {AdaptiveLimiter} -- Limiter to hold a slot of (default: None)
+        timings {dict} -- If provided, seconds waited are stored as timings['throttle'] (default: None)
+    """
+    if limiter is None:
+        yield
+    else:
+        with limiter.slot(timings):
+            yield
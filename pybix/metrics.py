@@ -0,0 +1,196 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Metrics
+    Contains instrumentation hooks and an aggregator for ZabbixAPI/GraphImage request timings
+"""
+
+import math
+import logging
+import threading
+from collections import namedtuple, defaultdict, deque
+
+logger = logging.getLogger(__name__)
+
+# Phases timed (in seconds) for each request:
+#   throttle -- waiting for an AdaptiveLimiter slot (only if a limiter is used)
+#   encode   -- serialising (and compressing if enabled) the request (JSON-RPC only)
+#   wait     -- sending request until response headers received (includes DNS/connect and server processing)
+#   download -- reading response body
+#   decode   -- parsing response body (JSON-RPC only)
+#   total    -- whole call including any retries
+PHASES = ('throttle', 'encode', 'wait', 'download', 'decode', 'total')
+
+RequestEvent = namedtuple('RequestEvent', [
+    'method',  # Zabbix API method (e.g. 'host.get') or GraphImage chart (e.g. 'graphimage.chart2')
+    'url',
+    'status',  # HTTP status code (None if no response)
+    'error',  # Exception raised by the call (None if successful)
+    'request_bytes',  # Uncompressed request body size
+    'response_bytes',  # Uncompressed response body size
+    'timings',  # {phase: seconds} for phases in PHASES that applied
+    'retries',
+    'cache_hit',
+    'request_wire_bytes',  # Request body size as sent, i.e. after any compression (None if same as request_bytes)
+    'response_wire_bytes',  # Response body size as received (None if same as response_bytes)
+])
+RequestEvent.__new__.__defaults__ = (None, None)
+
+
+class EventHooks(object):
+    """Mixin that lets callers register hooks called with a RequestEvent after every request
+        Hooks are called synchronously in the requesting thread so should be quick
+    """
+
+    def add_hook(self, hook):
+        """Register hook to be called with RequestEvent after every request
+
+        Arguments:
+            hook {callable} -- Callable taking a single RequestEvent argument (e.g. MetricsAggregator())
+        """
+        self.HOOKS.append(hook)
+
+    def remove_hook(self, hook):
+        """Unregister hook previously added by add_hook
+
+        Arguments:
+            hook {callable} -- Hook to remove
+        """
+        self.HOOKS.remove(hook)
+
+    def _emit(self, event: RequestEvent):
+        for hook in list(self.HOOKS):
+            try:
+                hook(event)
+            except Exception as ex:
+                logger.warning(f"_emit(): Hook {hook} failed: {ex}")
+
+
+def percentile(values: list, percent: float) -> float:
+    """Nearest-rank percentile of values
+
+    Arguments:
+        values {list(float)} -- Values to get percentile of (need not be sorted)
+        percent {float} -- Percentile between 0 and 100 (e.g. 95)
+
+    Returns:
+        percentile {float} -- The percentile value (0.0 if no values)
+    """
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(int(math.ceil(percent / 100.0 * len(ordered))), 1)
+    return ordered[rank - 1]
+
+
+class MetricsAggregator(object):
+    """Hook that aggregates RequestEvents per method for latency percentiles and totals
+
+        e.g.
+            METRICS = MetricsAggregator()
+            ZAPI.add_hook(METRICS)
+            ...
+            print(METRICS.report())
+    """
+    QUANTILES = (50, 95, 99)
+
+    def __init__(self, max_samples: int = 10000):
+        """Initialise the aggregator
+
+        Arguments:
+            max_samples {int} -- Most recent latencies to keep per method for percentiles (default: 10000)
+        """
+        self.MAX_SAMPLES = max_samples
+        self.LOCK = threading.Lock()
+        self.reset()
+
+    def __call__(self, event: RequestEvent):
+        with self.LOCK:
+            self.LATENCIES[event.method].append(event.timings.get('total', 0.0))
+            totals = self.TOTALS[event.method]
+            totals['count'] += 1
+            totals['errors'] += 1 if event.error else 0
+            totals['retries'] += event.retries
+            totals['cache_hits'] += 1 if event.cache_hit else 0
+            totals['request_bytes'] += event.request_bytes
+            totals['response_bytes'] += event.response_bytes
+            request_wire_bytes = event.request_bytes if event.request_wire_bytes is None \
+                else event.request_wire_bytes
+            response_wire_bytes = event.response_bytes if event.response_wire_bytes is None \
+                else event.response_wire_bytes
+            totals['request_wire_bytes'] += request_wire_bytes
+            totals['response_wire_bytes'] += response_wire_bytes
+            totals['bytes_saved'] += event.request_bytes - request_wire_bytes \
+                + event.response_bytes - response_wire_bytes
+            for phase, seconds in event.timings.items():
+                totals[f"{phase}_seconds"] += seconds
+
+    def reset(self):
+        """Clear all aggregated metrics"""
+        with self.LOCK:
+            self.LATENCIES = defaultdict(lambda: deque(maxlen=self.MAX_SAMPLES))
+            self.TOTALS = defaultdict(lambda: defaultdict(float))
+
+    def summary(self) -> dict:
+        """Summary of aggregated metrics per method
+
+        Returns:
+            summary {dict} -- {method: {'count', 'errors', 'retries', 'cache_hits', 'request_bytes',
+                                        'response_bytes', 'request_wire_bytes', 'response_wire_bytes',
+                                        'bytes_saved', '<phase>_seconds', 'p50', 'p95', 'p99'}}
+        """
+        with self.LOCK:
+            summary = {}
+            for method, latencies in self.LATENCIES.items():
+                summary[method] = dict(self.TOTALS[method])
+                for quantile in self.QUANTILES:
+                    summary[method][f"p{quantile}"] = percentile(latencies, quantile)
+            return summary
+
+    def report(self) -> str:
+        """Human readable table of per method latency percentiles (in milliseconds)
+
+        Returns:
+            report {str} -- Table with a row per method
+        """
+        lines = [f"{'method':<32} {'count':>8} {'errors':>7} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} "
+                 f"{'sent B':>11} {'recv B':>11} {'saved B':>11}"]
+        for method, stats in sorted(self.summary().items()):
+            lines.append(
+                f"{method:<32} {int(stats['count']):>8} {int(stats['errors']):>7} "
+                f"{stats['p50'] * 1000:>9.2f} {stats['p95'] * 1000:>9.2f} {stats['p99'] * 1000:>9.2f} "
+                f"{int(stats['request_wire_bytes']):>11} {int(stats['response_wire_bytes']):>11} "
+                f"{int(stats['bytes_saved']):>11}")
+        return "\n".join(lines)
+
+    def prometheus(self, prefix: str = 'pybix') -> str:
+        """Prometheus text exposition format of aggregated metrics
+
+        Arguments:
+            prefix {str} -- Metric name prefix (default: pybix)
+
+        Returns:
+            metrics {str} -- Metrics in Prometheus text format (e.g. to serve on /metrics or for textfile collector)
+        """
+        summary = self.summary()
+        lines = [f"# HELP {prefix}_request_duration_seconds Zabbix request latency by method",
+                 f"# TYPE {prefix}_request_duration_seconds summary"]
+        for method, stats in sorted(summary.items()):
+            for quantile in self.QUANTILES:
+                lines.append(f'{prefix}_request_duration_seconds{{method="{method}",quantile="{quantile / 100}"}} '
+                             f"{stats[f'p{quantile}']}")
+            lines.append(f'{prefix}_request_duration_seconds_sum{{method="{method}"}} {stats["total_seconds"]}')
+            lines.append(f'{prefix}_request_duration_seconds_count{{method="{method}"}} {int(stats["count"])}')
+
+        counters = (('request_errors_total', 'errors', 'Zabbix requests that raised an error'),
+                    ('request_retries_total', 'retries', 'Zabbix request retries'),
+                    ('request_cache_hits_total', 'cache_hits', 'Zabbix requests served without a request'),
+                    ('request_sent_bytes_total', 'request_wire_bytes', 'Zabbix request body bytes sent'),
+                    ('request_received_bytes_total', 'response_wire_bytes', 'Zabbix response body bytes received'),
+                    ('request_compression_saved_bytes_total', 'bytes_saved',
+                     'Zabbix request/response body bytes saved by compression'))
+        for name, key, description in counters:
+            lines.append(f"# HELP {prefix}_{name} {description}")
+            lines.append(f"# TYPE {prefix}_{name} counter")
+            for method, stats in sorted(summary.items()):
+                lines.append(f'{prefix}_{name}{{method="{method}"}} {int(stats[key])}')
+        return "\n".join(lines) + "\n"
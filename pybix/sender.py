@@ -0,0 +1,370 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Sender
+    Contains a native Zabbix sender (trapper protocol) client for pushing item values
+    to a Zabbix server/proxy, like zabbix_sender but without forking a process per call
+"""
+
+import os
+import re
+import json
+import time
+import zlib
+import select
+import socket
+import struct
+import asyncio
+import logging
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+ZBXD_MAGIC = b'ZBXD'
+ZBXD_PROTOCOL = 0x01
+ZBXD_COMPRESSED = 0x02
+ZBXD_LARGE = 0x04
+ZBXD_HEADER = struct.Struct('<4sBII')
+ZBXD_LARGE_HEADER = struct.Struct('<4sBQQ')
+
+INFO_PATTERN = re.compile(
+    r'processed:\s*(\d+);\s*failed:\s*(\d+);\s*total:\s*(\d+);\s*seconds spent:\s*([\d.]+)')
+
+ZabbixMetric = namedtuple('ZabbixMetric', ['host', 'key', 'value', 'clock', 'ns'])
+ZabbixMetric.__new__.__defaults__ = (None, None)  # clock/ns optional (server receive time if None)
+
+BatchResult = namedtuple('BatchResult', ['processed', 'failed', 'total', 'seconds', 'error'])
+
+
+class ZabbixSenderException(Exception):
+    """Zabbix Sender Exception (invalid or unsuccessful trapper response)"""
+    pass
+
+
+class _NoResponse(ConnectionError):
+    """Connection reset or closed before any of the response was received, so the batch can be resent"""
+    pass
+
+
+class SenderResponse(object):
+    """Totals of all batches sent by ZabbixSender.send"""
+
+    def __init__(self, batches: list = None):
+        self.BATCHES = batches or []
+
+    def __repr__(self):
+        return (f"SenderResponse(processed={self.processed}, failed={self.failed}, total={self.total}, "
+                f"seconds={self.seconds:.6f}, batches={len(self.BATCHES)})")
+
+    @property
+    def processed(self) -> int:
+        return sum(batch.processed for batch in self.BATCHES)
+
+    @property
+    def failed(self) -> int:
+        return sum(batch.failed for batch in self.BATCHES)
+
+    @property
+    def total(self) -> int:
+        return sum(batch.total for batch in self.BATCHES)
+
+    @property
+    def seconds(self) -> float:
+        """Seconds spent by server processing all batches"""
+        return sum(batch.seconds for batch in self.BATCHES)
+
+    @property
+    def errors(self) -> list:
+        """Exceptions for batches that could not be sent"""
+        return [batch.error for batch in self.BATCHES if batch.error]
+
+
+def pack(payload: dict, compress: bool = False) -> bytes:
+    """Build ZBXD packet for payload
+
+    Arguments:
+        payload {dict} -- JSON request, e.g. {"request": "sender data", "data": [...]}
+        compress {bool} -- Whether to zlib compress the data (Zabbix 4.0+) (default: False)
+
+    Returns:
+        packet {bytes} -- Header and data
+    """
+    data = json.dumps(payload, separators=(',', ':')).encode('utf-8')
+    if compress:
+        compressed = zlib.compress(data)
+        return ZBXD_HEADER.pack(ZBXD_MAGIC, ZBXD_PROTOCOL | ZBXD_COMPRESSED, len(compressed), len(data)) + compressed
+    return ZBXD_HEADER.pack(ZBXD_MAGIC, ZBXD_PROTOCOL, len(data), 0) + data
+
+
+def unpack(header: bytes, read) -> dict:
+    """Parse ZBXD packet, reading the data with read(length)
+
+    Arguments:
+        header {bytes} -- First ZBXD_HEADER.size bytes of packet
+        read {callable} -- Function returning exactly n more bytes of packet when called with n
+
+    Returns:
+        payload {dict} -- The parsed JSON data
+    """
+    magic, flags, length, reserved = ZBXD_HEADER.unpack(header)
+    if magic != ZBXD_MAGIC:
+        raise ZabbixSenderException(f"Invalid response header {header!r}")
+    if flags & ZBXD_LARGE:
+        # Lengths are 8 bytes rather than 4, so read the rest of the larger header
+        magic, flags, length, reserved = ZBXD_LARGE_HEADER.unpack(header + read(ZBXD_LARGE_HEADER.size
+                                                                                - ZBXD_HEADER.size))
+    data = read(length)
+    if flags & ZBXD_COMPRESSED:
+        data = zlib.decompress(data)
+    return json.loads(data.decode('utf-8'))
+
+
+def batch_result(response: dict) -> BatchResult:
+    """Convert trapper response to BatchResult
+
+    Arguments:
+        response {dict} -- Trapper response, e.g. {"response": "success", "info": "processed: 1; failed: 0; ..."}
+
+    Returns:
+        result {BatchResult} -- Counts reported by server
+    """
+    if response.get('response') != 'success':
+        raise ZabbixSenderException(f"Unsuccessful response: {response}")
+    match = INFO_PATTERN.search(response.get('info', ''))
+    if not match:
+        raise ZabbixSenderException(f"Unable to parse response info: {response}")
+    processed, failed, total, seconds = match.groups()
+    return BatchResult(int(processed), int(failed), int(total), float(seconds), None)
+
+
+class ZabbixSender(object):
+    """Sends item values to Zabbix trapper items over the ZBXD protocol
+
+        e.g.
+            with ZabbixSender("zabbix.example.com", workers=4, compress=True) as SENDER:
+                response = SENDER.send([ZabbixMetric("server1", "custom.metric", 1.5)])
+                print(response.processed, response.failed)
+    """
+
+    def __init__(self,
+                 server: str = None,
+                 port: int = 10051,
+                 chunk_size: int = 1000,
+                 compress: bool = False,
+                 timeout: float = 10,
+                 workers: int = 1):
+        """Initialise the sender (but not connect)
+
+        Arguments:
+            server {str} -- Zabbix server/proxy address (default: ZABBIX_SENDER_SERVER environment variable or 127.0.0.1)
+            port {int} -- Zabbix trapper port (default: 10051)
+            chunk_size {int} -- Values per packet (default: 1000)
+            compress {bool} -- Whether to zlib compress packets, requires Zabbix 4.0+ (default: False)
+            timeout {float} -- Socket timeout in seconds (default: 10)
+            workers {int} -- Batches to send concurrently, each over its own connection (default: 1)
+        """
+        self.SERVER = server or os.environ.get('ZABBIX_SENDER_SERVER') or '127.0.0.1'
+        self.PORT = int(port)
+        self.CHUNK_SIZE = chunk_size
+        self.COMPRESS = compress
+        self.TIMEOUT = timeout
+        self.WORKERS = workers
+
+        self.LOCAL = threading.local()
+        self.SOCKETS = []
+        self.LOCK = threading.Lock()
+        # Kept between send() calls so worker threads keep their connections
+        self.EXECUTOR = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exception_type, exception_value, traceback):
+        self.close()
+
+    def close(self):
+        """Close all connections opened by the sender"""
+        if self.EXECUTOR:
+            self.EXECUTOR.shutdown()
+            self.EXECUTOR = None
+        with self.LOCK:
+            for sock in self.SOCKETS:
+                sock.close()
+            self.SOCKETS = []
+        self.LOCAL = threading.local()
+
+    def _chunks(self, metrics: list) -> list:
+        return [metrics[n:n + self.CHUNK_SIZE] for n in range(0, len(metrics), self.CHUNK_SIZE)]
+
+    def _payload(self, batch: list) -> dict:
+        now = time.time()
+        data = []
+        for metric in batch:
+            value = {'host': metric.host, 'key': metric.key, 'value': str(metric.value)}
+            if metric.clock is not None:
+                value['clock'] = int(metric.clock)
+                value['ns'] = int(metric.ns or 0)
+            data.append(value)
+        return {'request': 'sender data', 'data': data, 'clock': int(now), 'ns': int(now % 1 * 1e9)}
+
+    def send(self, metrics: list) -> SenderResponse:
+        """Send metrics in batches of chunk_size (across workers threads)
+
+        Arguments:
+            metrics {list(ZabbixMetric)} -- Values to send
+
+        Returns:
+            response {SenderResponse} -- Per batch and total processed/failed counts
+        """
+        batches = self._chunks(list(metrics))
+        if self.WORKERS > 1 and len(batches) > 1:
+            with self.LOCK:
+                if not self.EXECUTOR:
+                    self.EXECUTOR = ThreadPoolExecutor(max_workers=self.WORKERS)
+            results = list(self.EXECUTOR.map(self._send_batch, batches))
+        else:
+            results = [self._send_batch(batch) for batch in batches]
+        return SenderResponse(results)
+
+    def _send_batch(self, batch: list) -> BatchResult:
+        packet = pack(self._payload(batch), self.COMPRESS)
+        try:
+            reused = getattr(self.LOCAL, 'sock', None) is not None
+            try:
+                response = self._exchange(packet)
+            except _NoResponse:
+                if not reused:
+                    raise
+                # Reused connection may have been closed by server between the check and send,
+                # so retry once on a new connection. Never after a timeout or part of a response,
+                # as the server may have processed the batch and resending would duplicate values
+                self._disconnect()
+                response = self._exchange(packet)
+            result = batch_result(response)
+        except (OSError, ValueError, ZabbixSenderException) as ex:
+            logger.error(f"_send_batch(): Unable to send {len(batch)} values to {self.SERVER}:{self.PORT}: {ex}")
+            self._disconnect()
+            return BatchResult(0, len(batch), len(batch), 0.0, ex)
+
+        logger.debug(f"_send_batch(): {result}")
+        return result
+
+    def _exchange(self, packet: bytes) -> dict:
+        sock = self._connection()
+        try:
+            sock.sendall(packet)
+            header = sock.recv(ZBXD_HEADER.size)
+        except ConnectionError as ex:
+            raise _NoResponse(f"Connection lost before response: {ex}") from ex
+        if not header:
+            raise _NoResponse("Connection closed by server before response")
+        header += self._read(sock, ZBXD_HEADER.size - len(header))
+        return unpack(header, lambda n: self._read(sock, n))
+
+    def _connection(self) -> socket.socket:
+        """Reuse this thread's connection if the server hasn't closed it, otherwise connect"""
+        sock = getattr(self.LOCAL, 'sock', None)
+        if sock is not None and self._is_closed(sock):
+            self._disconnect()
+            sock = None
+        if sock is None:
+            sock = socket.create_connection((self.SERVER, self.PORT), timeout=self.TIMEOUT)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            self.LOCAL.sock = sock
+            with self.LOCK:
+                self.SOCKETS.append(sock)
+        return sock
+
+    def _disconnect(self):
+        sock = getattr(self.LOCAL, 'sock', None)
+        if sock is not None:
+            sock.close()
+            with self.LOCK:
+                if sock in self.SOCKETS:
+                    self.SOCKETS.remove(sock)
+            self.LOCAL.sock = None
+
+    @staticmethod
+    def _is_closed(sock: socket.socket) -> bool:
+        """Whether the peer has closed an idle connection (readable with no data)"""
+        try:
+            readable, _, _ = select.select([sock], [], [], 0)
+            return bool(readable) and not sock.recv(1, socket.MSG_PEEK)
+        except (OSError, ValueError):
+            return True
+
+    @staticmethod
+    def _read(sock: socket.socket, length: int) -> bytes:
+        data = b''
+        while len(data) < length:
+            chunk = sock.recv(length - len(data))
+            if not chunk:
+                raise ConnectionError("Connection closed by server")
+            data += chunk
+        return data
+
+    async def async_send(self, metrics: list) -> SenderResponse:
+        """Send metrics in batches of chunk_size using asyncio (workers batches in flight at a time)
+
+        Arguments:
+            metrics {list(ZabbixMetric)} -- Values to send
+
+        Returns:
+            response {SenderResponse} -- Per batch and total processed/failed counts
+        """
+        semaphore = asyncio.Semaphore(self.WORKERS)
+
+        async def send_batch(batch):
+            async with semaphore:
+                return await self._async_send_batch(batch)
+
+        results = await asyncio.gather(*[send_batch(batch) for batch in self._chunks(list(metrics))])
+        return SenderResponse(list(results))
+
+    async def _async_send_batch(self, batch: list) -> BatchResult:
+        packet = pack(self._payload(batch), self.COMPRESS)
+        writer = None
+        try:
+            reader, writer = await asyncio.wait_for(asyncio.open_connection(self.SERVER, self.PORT),
+                                                    self.TIMEOUT)
+            writer.write(packet)
+            await writer.drain()
+            response = await asyncio.wait_for(self._async_read(reader), self.TIMEOUT)
+            result = batch_result(response)
+        except (OSError, ValueError, asyncio.TimeoutError, asyncio.IncompleteReadError,
+                ZabbixSenderException) as ex:
+            logger.error(f"_async_send_batch(): Unable to send {len(batch)} values to {self.SERVER}:{self.PORT}: "
+                         f"{ex!r}")
+            return BatchResult(0, len(batch), len(batch), 0.0, ex)
+        finally:
+            if writer is not None:
+                writer.close()
+
+        logger.debug(f"_async_send_batch(): {result}")
+        return result
+
+    @staticmethod
+    async def _async_read(reader: asyncio.StreamReader) -> dict:
+        header = await reader.readexactly(ZBXD_HEADER.size)
+        if header[4] & ZBXD_LARGE:
+            header += await reader.readexactly(ZBXD_LARGE_HEADER.size - ZBXD_HEADER.size)
+            length = ZBXD_LARGE_HEADER.unpack(header)[2]
+        else:
+            length = ZBXD_HEADER.unpack(header)[2]
+        # Read whole packet up front as unpack() needs a synchronous read
+        data = header[ZBXD_HEADER.size:] + await reader.readexactly(length)
+        return unpack(header[:ZBXD_HEADER.size], _BufferReader(data).read)
+
+
+class _BufferReader(object):
+    def __init__(self, data: bytes):
+        self.DATA = data
+        self.OFFSET = 0
+
+    def read(self, length: int) -> bytes:
+        if self.OFFSET + length > len(self.DATA):
+            raise ConnectionError("Connection closed by server")
+        data = self.DATA[self.OFFSET:self.OFFSET + length]
+        self.OFFSET += length
+        return data
@@ -0,0 +1,298 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Server
+    Contains a long-running local server that keeps Zabbix sessions authenticated
+    so other scripts/languages on the box can dispatch calls without logging in each time.
+    Requests are not authenticated, so anyone able to connect can use the Zabbix session: the TCP
+    listener is open to every local user, whereas the unix socket is only accessible by its owner
+"""
+
+import os
+import json
+import stat
+import socket
+import logging
+import threading
+import socketserver
+from http.server import HTTPServer, BaseHTTPRequestHandler
+from pybix.api import ZabbixAPIException
+from pybix.graph import GraphImageAPI
+from pybix.metrics import MetricsAggregator
+
+logger = logging.getLogger(__name__)
+
+# Methods that are managed by the server itself so cannot be passed through
+RESERVED_METHODS = ('user.login', 'user.logout')
+
+
+class PybixServer(object):
+    """Holds the authenticated ZabbixAPI/GraphImageAPI sessions and dispatches
+        JSON-RPC passthrough and graph export requests to them
+    """
+
+    def __init__(self,
+                 url: str = None,
+                 user: str = None,
+                 password: str = None,
+                 output_path: str = None,
+                 ssl_verify: bool = True):
+        """Initialise the server sessions (ZabbixAPI login is immediate, frontend on first graph requested)
+
+        Arguments:
+            url {str} -- Base URL to Zabbix (default: ZABBIX_SERVER environment variable or
+                                             https://localhost/zabbix)
+            user {str} -- Zabbix Username (default: ZABBIX_USER environment variable or 'Admin')
+            password {str} -- Zabbix Password (default: ZABBIX_PASSWORD environment variable or 'zabbix')
+            output_path {str} -- Path of directory to save graphs to (default: os.getcwd())
+            ssl_verify {bool} -- Whether to attempt SSL verification during call (default: True)
+        """
+        self.USER = user
+        self.PASSWORD = password
+        self.LOGIN_LOCK = threading.Lock()
+
+        # GraphImageAPI shares a single connection pool between its ZabbixAPI and frontend sessions.
+        # Results are serialised per client, so identical concurrent reads can safely share a result
+        self.GRAPH = GraphImageAPI(url=url,
+                                   user=user,
+                                   password=password,
+                                   output_path=output_path,
+                                   ssl_verify=ssl_verify,
+                                   coalesce=True)
+        self.ZAPI = self.GRAPH.ZAPI
+        self.METRICS = MetricsAggregator()
+        self.GRAPH.add_hook(self.METRICS)
+
+    def close(self):
+        """Logout of any sessions held by the server"""
+        self.ZAPI.logout()
+
+    def do_request(self, method: str, params: dict = None):
+        """Pass through a Zabbix API call, logging back in once if the session has expired
+
+        Arguments:
+            method {str} -- Zabbix API method (e.g. 'host.get')
+            params {dict} -- Parameters relevant to API call as per Zabbix documentation
+
+        Returns:
+            result -- The 'result' of the successful JSON response
+        """
+        if method in RESERVED_METHODS:
+            raise ZabbixAPIException(
+                f"Unable to perform '{method}' via server, sessions are handled by the server.")
+
+        auth = self.ZAPI.AUTH
+        try:
+            return self.ZAPI.do_request(method, params)['result']
+        except ZabbixAPIException as ex:
+            if not self._is_session_expired(ex):
+                raise
+            # Concurrent (e.g. coalesced) requests all see the expiry, so only the first logs back in
+            with self.LOGIN_LOCK:
+                if self.ZAPI.AUTH == auth:
+                    logger.info(f"PybixServer: Session expired ({ex}), logging back in")
+                    self.ZAPI.AUTH = ''
+                    self.ZAPI.login(self.USER, self.PASSWORD)
+            return self.ZAPI.do_request(method, params)['result']
+
+    def graph_image(self, search_type: str, **kwargs):
+        """Export graph image(s) via GraphImageAPI.get
+
+        Arguments:
+            search_type {str} -- One of (graph_id, graph_name, item_names, item_keys, item_ids)
+            kwargs {dict} -- Key/values to pass through as parameters
+
+        Returns:
+            file_name {str|list} -- The name(s) of the saved graph image(s)
+        """
+        return self.GRAPH.get(search_type, **kwargs)
+
+    @staticmethod
+    def _is_session_expired(ex: ZabbixAPIException) -> bool:
+        return 're-login' in str(ex) or 'Not authorised' in str(ex)
+
+
+class PybixRequestHandler(BaseHTTPRequestHandler):
+    """HTTP handler for PybixServer
+        POST /api_jsonrpc.php       -- JSON-RPC request body, e.g. {"method": "host.get", "params": {}, "id": 1}
+        POST /graphimage/<type>     -- JSON object of GraphImageAPI.get kwargs, e.g. {"graph_id": "4038"}
+        GET  /health                -- Whether server is up and ZabbixAPI session is held
+        GET  /metrics               -- Request metrics in Prometheus text format
+    """
+    server_version = 'pybix'
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        # Headers and body are written separately, so avoid Nagle delaying the body on keep-alive connections.
+        # Only for TCP, as setting TCP_NODELAY on a unix socket raises OSError
+        self.disable_nagle_algorithm = self.server.address_family in (socket.AF_INET, socket.AF_INET6)
+        super().setup()
+
+    def log_message(self, format, *args):
+        # Unix sockets have no client address, so avoid BaseHTTPRequestHandler.address_string()
+        logger.debug(f"PybixRequestHandler: {format % args}")
+
+    def do_GET(self):
+        if self.path.rstrip('/') == '/health':
+            self._send_json(200, {'authenticated': bool(self.server.PYBIX.ZAPI.AUTH)})
+        elif self.path.rstrip('/') == '/metrics':
+            data = self.server.PYBIX.METRICS.prometheus().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+        else:
+            self._send_json(404, {'error': f"Unknown path {self.path}"})
+
+    def do_POST(self):
+        try:
+            length = int(self.headers.get('Content-Length') or 0)
+            body = json.loads(self.rfile.read(length) or b'{}')
+        except ValueError as ex:
+            self._send_json(400, {'jsonrpc': '2.0',
+                                  'error': {'code': -32700, 'message': 'Parse error', 'data': str(ex)},
+                                  'id': None})
+            return
+
+        if self.path.startswith('/graphimage/'):
+            self._handle_graph_image(self.path[len('/graphimage/'):].strip('/'), body)
+        elif self.path.rstrip('/') in ('', '/api_jsonrpc.php'):
+            self._handle_jsonrpc(body)
+        else:
+            self._send_json(404, {'error': f"Unknown path {self.path}"})
+
+    def _handle_jsonrpc(self, body: dict):
+        if not isinstance(body, dict):  # e.g. a JSON-RPC batch, which isn't supported
+            self._send_json(400, {'jsonrpc': '2.0',
+                                  'error': {'code': -32600, 'message': 'Invalid Request',
+                                            'data': 'Request must be a JSON object'},
+                                  'id': None})
+            return
+
+        request_id = body.get('id')
+        if 'method' not in body:
+            self._send_json(400, {'jsonrpc': '2.0',
+                                  'error': {'code': -32600, 'message': 'Invalid Request',
+                                            'data': 'Missing method'},
+                                  'id': request_id})
+            return
+
+        try:
+            result = self.server.PYBIX.do_request(body['method'], body.get('params'))
+        except ZabbixAPIException as ex:
+            code = ex.args[1] if len(ex.args) > 1 else -32500
+            self._send_json(200, {'jsonrpc': '2.0',
+                                  'error': {'code': code, 'message': 'Application error', 'data': ex.args[0]},
+                                  'id': request_id})
+            return
+        except Exception as ex:
+            logger.error(f"PybixRequestHandler: {body.get('method')} failed: {ex}")
+            self._send_json(502, {'jsonrpc': '2.0',
+                                  'error': {'code': -32300, 'message': 'Transport error', 'data': str(ex)},
+                                  'id': request_id})
+            return
+
+        self._send_json(200, {'jsonrpc': '2.0', 'result': result, 'id': request_id})
+
+    def _handle_graph_image(self, search_type: str, body: dict):
+        if not isinstance(body, dict):
+            self._send_json(400, {'error': 'Request must be a JSON object of GraphImageAPI.get parameters'})
+            return
+
+        try:
+            result = self.server.PYBIX.graph_image(search_type, **body)
+        except (ValueError, TypeError) as ex:
+            self._send_json(400, {'error': str(ex)})
+            return
+        except Exception as ex:
+            logger.error(f"PybixRequestHandler: graphimage.{search_type} failed: {ex}")
+            self._send_json(502, {'error': str(ex)})
+            return
+
+        self._send_json(200, {'result': result})
+
+    def _send_json(self, status: int, body: dict):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+class ThreadingHTTPServer(socketserver.ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+if hasattr(socket, 'AF_UNIX'):
+    class ThreadingUnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+        daemon_threads = True
+
+
+def make_server(pybix_server: PybixServer,
+                host: str = '127.0.0.1',
+                port: int = 8090,
+                socket_path: str = None) -> socketserver.BaseServer:
+    """Bind (but not start) the HTTP server for pybix_server
+
+    Arguments:
+        pybix_server {PybixServer} -- The server holding the Zabbix sessions
+        host {str} -- Address to listen on (default: 127.0.0.1)
+        port {int} -- Port to listen on (default: 8090)
+        socket_path {str} -- Unix socket to listen on instead of host/port, replacing any stale socket
+                             there, readable/writable by the owner only (default: None)
+
+    Returns:
+        httpd {socketserver.BaseServer} -- Bound server, with serve_forever() to start
+    """
+    if socket_path:
+        try:
+            mode = os.lstat(socket_path).st_mode
+        except FileNotFoundError:
+            mode = None
+        if mode is not None:
+            if not stat.S_ISSOCK(mode):
+                raise ValueError(f"Refusing to replace {socket_path} as it exists and is not a socket")
+            os.unlink(socket_path)
+        # Requests aren't authenticated, so only the owner may connect (umask closes the gap until chmod)
+        umask = os.umask(0o177)
+        try:
+            httpd = ThreadingUnixHTTPServer(socket_path, PybixRequestHandler)
+        finally:
+            os.umask(umask)
+        os.chmod(socket_path, 0o600)
+        logger.info(f"make_server(): Listening on unix socket {socket_path}")
+    else:
+        httpd = ThreadingHTTPServer((host, int(port)), PybixRequestHandler)
+        logger.info(f"make_server(): Listening on http://{host}:{port}, open to all local users")
+    httpd.PYBIX = pybix_server
+    return httpd
+
+
+def serve(pybix_server: PybixServer,
+          host: str = '127.0.0.1',
+          port: int = 8090,
+          socket_path: str = None):
+    """Serve requests until interrupted, logging out of all sessions on exit
+
+    Arguments:
+        pybix_server {PybixServer} -- The server holding the Zabbix sessions
+        host {str} -- Address to listen on (default: 127.0.0.1)
+        port {int} -- Port to listen on (default: 8090)
+        socket_path {str} -- Unix socket to listen on instead of host/port (default: None)
+    """
+    try:
+        httpd = make_server(pybix_server, host, port, socket_path)
+    except BaseException:
+        pybix_server.close()
+        raise
+
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        httpd.server_close()
+        if socket_path and os.path.exists(socket_path):
+            os.unlink(socket_path)
+        pybix_server.close()
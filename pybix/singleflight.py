@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Single Flight
+    Contains request coalescing so identical concurrent calls share one in-flight call and result
+"""
+
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class _Call(object):
+    def __init__(self):
+        self.DONE = threading.Event()
+        self.RESULT = None
+        self.ERROR = None
+
+
+class SingleFlight(object):
+    """Coalesces concurrent calls with the same key into one call of fn, e.g.
+
+        FLIGHT = SingleFlight()
+        result, shared = FLIGHT.do("host.get{}", lambda: ZAPI.host.get())
+
+        Callers arriving while a call for key is in flight wait for and share its result
+        (the same object, so should not be mutated) or exception. Once the call completes
+        the next call for key runs again, i.e. results are not cached.
+    """
+
+    def __init__(self):
+        self.LOCK = threading.Lock()
+        self.CALLS = {}
+
+    def do(self, key, fn) -> tuple:
+        """Call fn, or wait for the in-flight call with the same key
+
+        Arguments:
+            key {hashable} -- Identifies identical calls
+            fn {callable} -- Function taking no arguments to call
+
+        Returns:
+            result -- Result of fn
+            shared {bool} -- Whether result came from another caller's call
+        """
+        with self.LOCK:
+            call = self.CALLS.get(key)
+            leader = call is None
+            if leader:
+                call = self.CALLS[key] = _Call()
+
+        if not leader:
+            call.DONE.wait()
+            if call.ERROR is not None:
+                raise call.ERROR
+            return call.RESULT, True
+
+        try:
+            call.RESULT = fn()
+        except BaseException as ex:
+            call.ERROR = ex
+            raise
+        finally:
+            with self.LOCK:
+                del self.CALLS[key]
+            call.DONE.set()
+        return call.RESULT, False
+
+    @property
+    def in_flight(self) -> int:
+        """Number of distinct calls currently in flight"""
+        with self.LOCK:
+            return len(self.CALLS)
@@ -0,0 +1,327 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Snapshot
+    Contains incremental configuration backups, which only re-export hosts/templates whose
+    lightweight *.get fingerprint changed and store exports content addressed on disk
+"""
+
+import os
+import json
+import time
+import difflib
+import hashlib
+import logging
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# Per configuration.export option: API object, ID/name fields and *.get parameters whose result
+# changes whenever the object's configuration does (config fields only, not e.g. host availability)
+EXPORT_TYPES = {
+    'templates': {
+        'object': 'template',
+        'id': 'templateid',
+        'name': 'host',
+        'params': {
+            'output': ['templateid', 'host', 'name', 'description'],
+            'selectGroups': ['groupid'],
+            'selectParentTemplates': ['templateid'],
+            'selectMacros': ['macro', 'value'],
+            'selectItems': ['key_', 'name', 'type', 'delay', 'history', 'trends', 'status', 'value_type',
+                            'units', 'description'],
+            'selectTriggers': ['description', 'expression', 'priority', 'status', 'comments'],
+            'selectGraphs': ['name', 'width', 'height', 'graphtype'],
+            'selectDiscoveries': ['key_', 'name', 'delay', 'status'],
+        },
+    },
+    'hosts': {
+        'object': 'host',
+        'id': 'hostid',
+        'name': 'host',
+        'params': {
+            'output': ['hostid', 'host', 'name', 'status', 'description', 'proxy_hostid', 'tls_connect',
+                       'tls_accept', 'inventory_mode'],
+            'selectGroups': ['groupid'],
+            'selectParentTemplates': ['templateid'],
+            'selectMacros': ['macro', 'value'],
+            'selectInterfaces': ['type', 'main', 'useip', 'ip', 'dns', 'port'],
+            'selectItems': ['key_', 'name', 'type', 'delay', 'history', 'trends', 'status', 'value_type',
+                            'units', 'description'],
+            'selectTriggers': ['description', 'expression', 'priority', 'status', 'comments'],
+            'selectGraphs': ['name', 'width', 'height', 'graphtype'],
+            'selectDiscoveries': ['key_', 'name', 'delay', 'status'],
+        },
+    },
+}
+
+# Outcome of ConfigSnapshot.take, lists of (export type, ID)
+SnapshotResult = namedtuple('SnapshotResult', ['name', 'added', 'modified', 'removed', 'unchanged'])
+
+# Difference of an object between two snapshots, status is 'added', 'modified' or 'removed'
+Change = namedtuple('Change', ['type', 'id', 'name', 'status', 'old_blob', 'new_blob'])
+
+
+def fingerprint(obj) -> str:
+    """SHA-256 of obj as canonical JSON, with lists sorted so they don't depend on result order"""
+    def canonical(value):
+        if isinstance(value, dict):
+            return {key: canonical(item) for key, item in value.items()}
+        if isinstance(value, list):
+            return sorted((canonical(item) for item in value), key=lambda item: json.dumps(item, sort_keys=True))
+        return value
+
+    return hashlib.sha256(json.dumps(canonical(obj), sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def snapshot_order(name: str) -> tuple:
+    """Sort key of snapshot name, i.e. its time then numeric suffix (so ...Z-10 comes after ...Z-2)"""
+    base, _, suffix = name.partition('-')
+    return (base, int(suffix)) if suffix.isdigit() else (base, 0)
+
+
+def normalise_export(export: str) -> str:
+    """JSON export indented for diffing, without the export date (Zabbix < 5.4) so unchanged exports are identical"""
+    data = json.loads(export)
+    data.get('zabbix_export', {}).pop('date', None)
+    return json.dumps(data, indent=2, ensure_ascii=False) + "\n"
+
+
+class ConfigSnapshot(object):
+    """Incremental backups of host/template configuration under path, e.g.
+
+        SNAPSHOT = ConfigSnapshot(ZAPI, '/var/backups/zabbix')
+        result = SNAPSHOT.take()  # Only exports objects whose fingerprint changed
+        print(SNAPSHOT.diff())  # Unified diff of the last two snapshots
+
+        Layout of path:
+            objects/<sha[:2]>/<sha> -- JSON configuration.export of one object, named by its SHA-256
+            snapshots/<name>.json -- Manifest of type -> ID -> {name, blob} per snapshot
+            index.json -- Fingerprint and blob per object as of the latest snapshot
+
+        Fingerprints only cover the fields in EXPORT_TYPES params (e.g. not item preprocessing or
+        LLD prototypes), so take(full=True) periodically to catch other changes.
+    """
+
+    def __init__(self,
+                 zabbix_api,
+                 path: str,
+                 types: tuple = ('templates', 'hosts'),
+                 workers: int = 4,
+                 export_types: dict = None):
+        """Initialise the snapshot store (but not take a snapshot)
+
+        Arguments:
+            zabbix_api {ZabbixAPI} -- Logged in ZabbixAPI to export with
+            path {str} -- Directory to store objects, snapshots and index in (created if missing)
+            types {tuple(str)} -- configuration.export options to back up (default: ('templates', 'hosts'))
+            workers {int} -- Exports in flight at once (default: 4)
+            export_types {dict} -- Fingerprint definitions overriding EXPORT_TYPES, e.g. for other
+                                   Zabbix versions (default: None)
+        """
+        self.ZAPI = zabbix_api
+        self.PATH = path
+        self.EXPORT_TYPES = dict(EXPORT_TYPES, **(export_types or {}))
+        unknown = [export_type for export_type in types if export_type not in self.EXPORT_TYPES]
+        if unknown:
+            raise ValueError(f"Invalid types {unknown}. Expecting {tuple(self.EXPORT_TYPES)}")
+        self.TYPES = tuple(types)
+        self.WORKERS = workers
+
+        os.makedirs(os.path.join(path, 'objects'), exist_ok=True)
+        os.makedirs(os.path.join(path, 'snapshots'), exist_ok=True)
+
+    def take(self, full: bool = False) -> SnapshotResult:
+        """Take a snapshot, exporting only new objects and those whose fingerprint changed
+
+        Arguments:
+            full {bool} -- Whether to export every object regardless of fingerprint (default: False)
+
+        Returns:
+            result {SnapshotResult} -- Snapshot name and (type, ID) of objects added, modified, removed
+                                       and unchanged since the last snapshot
+        """
+        index = self._read_json(os.path.join(self.PATH, 'index.json')) or {}
+        new_index = {}
+        exports = []
+        added, modified, removed, unchanged = [], [], [], []
+
+        for export_type in self.TYPES:
+            definition = self.EXPORT_TYPES[export_type]
+            previous = index.get(export_type, {})
+            current = new_index[export_type] = {}
+            objects = self.ZAPI.do_request(f"{definition['object']}.get", definition['params'])['result']
+            for obj in objects:
+                objectid = obj[definition['id']]
+                entry = current[objectid] = {'name': obj.get(definition['name']), 'fingerprint': fingerprint(obj)}
+                old = previous.get(objectid)
+                if old and not full and old['fingerprint'] == entry['fingerprint'] and self._has_blob(old['blob']):
+                    entry['blob'] = old['blob']
+                    unchanged.append((export_type, objectid))
+                else:
+                    exports.append((export_type, objectid))
+            removed.extend((export_type, objectid) for objectid in previous if objectid not in current)
+
+        logger.debug(f"ConfigSnapshot.take(): Exporting {len(exports)} objects, {len(unchanged)} unchanged")
+        with ThreadPoolExecutor(max_workers=self.WORKERS) as executor:
+            blobs = list(executor.map(lambda export: self._export(*export), exports))
+
+        for (export_type, objectid), blob in zip(exports, blobs):
+            entry = new_index[export_type][objectid]
+            old = index.get(export_type, {}).get(objectid)
+            entry['blob'] = blob
+            if old is None:
+                added.append((export_type, objectid))
+            elif old['blob'] != blob:
+                modified.append((export_type, objectid))
+            else:
+                unchanged.append((export_type, objectid))  # Fingerprint changed but not the export
+
+        name = self._write_manifest(new_index)
+        self._write_json(os.path.join(self.PATH, 'index.json'), new_index)
+        result = SnapshotResult(name, added, modified, removed, unchanged)
+        logger.info(f"ConfigSnapshot.take(): {name} added={len(added)} modified={len(modified)} "
+                    f"removed={len(removed)} unchanged={len(unchanged)}")
+        return result
+
+    def snapshots(self) -> list:
+        """Names of snapshots taken, oldest first"""
+        return sorted((file_name[:-len('.json')] for file_name in os.listdir(os.path.join(self.PATH, 'snapshots'))
+                       if file_name.endswith('.json')), key=snapshot_order)
+
+    def load(self, name: str) -> dict:
+        """Manifest of snapshot name, i.e. {type: {ID: {'name': ..., 'blob': ...}}}"""
+        manifest = self._read_json(os.path.join(self.PATH, 'snapshots', f"{name}.json"))
+        if manifest is None:
+            raise ValueError(f"No snapshot {name} in {self.PATH}")
+        return manifest['objects']
+
+    def read(self, blob: str) -> str:
+        """Export stored as blob"""
+        with open(self._blob_path(blob), encoding='utf-8') as f:
+            return f.read()
+
+    def changes(self, old: str = None, new: str = None) -> list:
+        """Objects that differ between two snapshots
+
+        Arguments:
+            old {str} -- Snapshot name (default: None - the one before new)
+            new {str} -- Snapshot name (default: None - latest)
+
+        Returns:
+            changes {list(Change)} -- Added, modified and removed objects
+        """
+        old, new = self._pair(old, new)
+        old_objects = self.load(old) if old else {}
+        new_objects = self.load(new)
+        changes = []
+        for export_type in sorted(set(old_objects) | set(new_objects)):
+            before = old_objects.get(export_type, {})
+            after = new_objects.get(export_type, {})
+            for objectid in sorted(set(before) | set(after), key=lambda objectid: (len(objectid), objectid)):
+                old_entry, new_entry = before.get(objectid), after.get(objectid)
+                if old_entry and new_entry and old_entry['blob'] == new_entry['blob']:
+                    continue
+                status = 'added' if old_entry is None else 'removed' if new_entry is None else 'modified'
+                changes.append(Change(export_type, objectid, (new_entry or old_entry)['name'], status,
+                                      old_entry and old_entry['blob'], new_entry and new_entry['blob']))
+        return changes
+
+    def diff(self, old: str = None, new: str = None, context: int = 3) -> str:
+        """Unified diff of the exports that differ between two snapshots
+
+        Arguments:
+            old {str} -- Snapshot name (default: None - the one before new)
+            new {str} -- Snapshot name (default: None - latest)
+            context {int} -- Lines of context around each change (default: 3)
+
+        Returns:
+            diff {str} -- Unified diff, one file per object named <type>/<name>
+        """
+        old, new = self._pair(old, new)
+        lines = []
+        for change in self.changes(old, new):
+            before = self.read(change.old_blob).splitlines(keepends=True) if change.old_blob else []
+            after = self.read(change.new_blob).splitlines(keepends=True) if change.new_blob else []
+            lines.extend(difflib.unified_diff(before, after,
+                                              f"{old}/{change.type}/{change.name}" if before else "/dev/null",
+                                              f"{new}/{change.type}/{change.name}" if after else "/dev/null",
+                                              n=context))
+        return "".join(lines)
+
+    def restore(self, name: str, export_type: str, objectid: str, rules: dict) -> bool:
+        """Import an object's configuration as of snapshot name via configuration.import
+
+        Arguments:
+            name {str} -- Snapshot name
+            export_type {str} -- Type of object, e.g. 'hosts'
+            objectid {str} -- ID of object when snapshot was taken
+            rules {dict} -- configuration.import rules, e.g. {'hosts': {'createMissing': True, 'updateExisting': True}}
+
+        Returns:
+            result {bool} -- Whether import succeeded
+        """
+        entry = self.load(name).get(export_type, {}).get(objectid)
+        if entry is None:
+            raise ValueError(f"No {export_type} {objectid} in snapshot {name}")
+        # 'import' is a Python keyword, so not callable as ZAPI.configuration.import
+        return self.ZAPI.do_request('configuration.import', {
+            'format': 'json',
+            'source': self.read(entry['blob']),
+            'rules': rules
+        })['result']
+
+    def _export(self, export_type: str, objectid: str) -> str:
+        """configuration.export object and store it, returning its blob SHA"""
+        export = self.ZAPI.configuration.export(format='json', options={export_type: [objectid]})
+        data = normalise_export(export).encode('utf-8')
+        blob = hashlib.sha256(data).hexdigest()
+        if not self._has_blob(blob):
+            self._write(self._blob_path(blob), data)
+        return blob
+
+    def _pair(self, old: str, new: str) -> tuple:
+        names = self.snapshots()
+        if not names:
+            raise ValueError(f"No snapshots in {self.PATH}")
+        new = new or names[-1]
+        if old is None:
+            earlier = [snapshot for snapshot in names if snapshot_order(snapshot) < snapshot_order(new)]
+            old = earlier[-1] if earlier else None
+        return old, new
+
+    def _write_manifest(self, index: dict) -> str:
+        name = base = time.strftime('%Y%m%dT%H%M%SZ', time.gmtime())
+        suffix = 1
+        while os.path.exists(os.path.join(self.PATH, 'snapshots', f"{name}.json")):
+            name = f"{base}-{suffix}"  # More than one snapshot in a second
+            suffix += 1
+        objects = {export_type: {objectid: {'name': entry['name'], 'blob': entry['blob']}
+                                 for objectid, entry in entries.items()}
+                   for export_type, entries in index.items()}
+        self._write_json(os.path.join(self.PATH, 'snapshots', f"{name}.json"),
+                         {'created': int(time.time()), 'objects': objects})
+        return name
+
+    def _blob_path(self, blob: str) -> str:
+        return os.path.join(self.PATH, 'objects', blob[:2], blob)
+
+    def _has_blob(self, blob: str) -> bool:
+        return bool(blob) and os.path.exists(self._blob_path(blob))
+
+    def _read_json(self, file_name: str):
+        if not os.path.exists(file_name):
+            return None
+        with open(file_name, encoding='utf-8') as f:
+            return json.load(f)
+
+    def _write_json(self, file_name: str, data):
+        self._write(file_name, json.dumps(data, indent=2, sort_keys=True).encode('utf-8'))
+
+    def _write(self, file_name: str, data: bytes):
+        """Write atomically, so an interrupted snapshot doesn't leave a truncated file"""
+        os.makedirs(os.path.dirname(file_name), exist_ok=True)
+        temp = f"{file_name}.tmp"
+        with open(temp, 'wb') as f:
+            f.write(data)
+        os.replace(temp, file_name)
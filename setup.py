@@ -29,6 +29,9 @@ setup(
     include_package_data=True,
     python_requires=">=3.6",
     install_requires=requires,
+    extras_require={
+        'brotli': ['brotli>=1.0'],  # Lets urllib3 accept/decode br compressed responses
+    },
     tests_require=test_requirements,
     zip_safe=False,
     classifiers=[
@@ -1,7 +1,11 @@
+import time
+import gzip
 import pytest
 import json
 import httpretty
+from concurrent.futures import ThreadPoolExecutor
 from pybix import ZabbixAPI
+from pybix.api import ZabbixAPIException
 
 
 class TestAPI(object):
@@ -141,3 +145,93 @@ class TestAPI(object):
         )
         ZAPI = ZabbixAPI("http://test.com")
         assert ZAPI.api_version == "4.0.0"
+
+    @httpretty.activate
+    def test_hooks(self):
+        response = {"jsonrpc": "2.0", "result": "4.0.0", "id": 0}
+        httpretty.register_uri(
+            httpretty.POST,
+            "http://test.com/api_jsonrpc.php",
+            body=json.dumps(response),
+        )
+        events = []
+        ZAPI = ZabbixAPI("http://test.com")
+        ZAPI.add_hook(events.append)
+        ZAPI.api_version
+
+        assert len(events) == 1
+        assert events[0].method == "apiinfo.version"
+        assert events[0].status == 200
+        assert events[0].error is None
+        assert events[0].response_bytes == len(json.dumps(response))
+        assert set(events[0].timings) == {'encode', 'wait', 'download', 'decode', 'total'}
+
+    @httpretty.activate
+    def test_hooks_error(self):
+        response = {
+            "jsonrpc": "2.0",
+            "error": {"code": -32602, "message": "Invalid params.", "data": "Not authorised."},
+            "id": 0
+        }
+        httpretty.register_uri(
+            httpretty.POST,
+            "http://test.com/api_jsonrpc.php",
+            body=json.dumps(response),
+        )
+        events = []
+        ZAPI = ZabbixAPI("http://test.com")
+        ZAPI.add_hook(events.append)
+        with pytest.raises(ZabbixAPIException):
+            ZAPI.host.get()
+
+        assert isinstance(events[0].error, ZabbixAPIException)
+
+    @httpretty.activate
+    def test_coalesce(self):
+        calls = []
+
+        def callback(request, uri, response_headers):
+            calls.append(json.loads(request.body.decode('utf-8'))['method'])
+            time.sleep(0.2)
+            return [200, response_headers, json.dumps({"jsonrpc": "2.0", "result": [{"hostid": "10084"}], "id": 0})]
+
+        httpretty.register_uri(
+            httpretty.POST,
+            "http://test.com/api_jsonrpc.php",
+            body=callback,
+        )
+        events = []
+        ZAPI = ZabbixAPI("http://test.com", coalesce=True)
+        ZAPI.add_hook(events.append)
+
+        with ThreadPoolExecutor(max_workers=5) as executor:
+            results = list(executor.map(lambda _: ZAPI.host.get(filter={'host': ['a', 'b']}, output='extend'),
+                                        range(5)))
+
+        assert calls == ["host.get"]
+        assert results == [[{"hostid": "10084"}]] * 5
+        assert len([event for event in events if event.cache_hit]) == 4
+        assert ZAPI.SINGLE_FLIGHT.in_flight == 0
+
+    @httpretty.activate
+    def test_compression(self):
+        response = json.dumps({"jsonrpc": "2.0", "result": [{"itemid": str(n)} for n in range(1000)], "id": 0})
+        httpretty.register_uri(
+            httpretty.POST,
+            "http://test.com/api_jsonrpc.php",
+            body=gzip.compress(response.encode('utf-8')),
+            adding_headers={'Content-Encoding': 'gzip'},
+        )
+        events = []
+        ZAPI = ZabbixAPI("http://test.com", compress_requests_over=100)
+        ZAPI.add_hook(events.append)
+
+        assert len(ZAPI.item.get(itemids=[str(n) for n in range(100)])) == 1000
+
+        last_request = httpretty.last_request()
+        assert "gzip" in last_request.headers['accept-encoding']
+        assert last_request.headers['content-encoding'] == "gzip"
+        assert json.loads(gzip.decompress(last_request.body))['params']['itemids'][99] == "99"
+        assert events[0].response_bytes == len(response)
+        assert events[0].response_wire_bytes < events[0].response_bytes
+        assert events[0].request_wire_bytes < events[0].request_bytes
@@ -0,0 +1,174 @@
+import json
+import time
+import pytest
+import httpretty
+import requests
+from pybix import ZabbixAPI, GraphImageAPI
+from pybix.balancer import FrontendPool, frontend_pool
+
+
+def overload():
+    response = requests.Response()
+    response.status_code = 503
+    return requests.HTTPError(response=response)
+
+
+class TestBalancer(object):
+    def test_frontend_pool(self):
+        assert frontend_pool("http://a.com") is None
+        assert frontend_pool(["http://a.com"]) is None
+        assert frontend_pool("http://a.com/api_jsonrpc.php, http://b.com/").URLS == ["http://a.com", "http://b.com"]
+        POOL = FrontendPool(["http://a.com", "http://b.com"])
+        assert frontend_pool(POOL) is POOL
+        with pytest.raises(ValueError):
+            FrontendPool([])
+
+    def test_least_outstanding(self):
+        POOL = FrontendPool(["http://a.com", "http://b.com", "http://c.com"])
+        first, second, third = POOL.acquire(), POOL.acquire(), POOL.acquire()
+        assert {first.URL, second.URL, third.URL} == set(POOL.URLS)
+
+        POOL.release(second, 0.01)
+        assert POOL.acquire() is second  # Only one with nothing in flight
+        assert POOL.acquire(exclude=tuple(POOL.FRONTENDS)) is None
+
+    def test_eject_on_failures(self):
+        POOL = FrontendPool(["http://a.com", "http://b.com"], max_failures=2)
+        a, b = POOL.FRONTENDS
+        for _ in range(2):
+            POOL.acquire()
+            POOL.release(a, 0.01, overload())
+        assert a.is_ejected
+        assert all(POOL.acquire() is b for _ in range(3))
+
+        # Not the frontend's fault, so not counted
+        POOL.acquire()
+        POOL.release(b, 0.01, ValueError("invalid params"))
+        assert b.FAILURES == 0
+
+        # Last frontend standing is never ejected
+        for _ in range(2):
+            POOL.release(b, 0.01, overload())
+        assert not b.is_ejected
+
+    def test_eject_slow(self):
+        POOL = FrontendPool(["http://a.com", "http://b.com"], slow_latency=0.5, slow_factor=3, min_samples=2)
+        a, b = POOL.FRONTENDS
+        for _ in range(2):
+            POOL.release(a, 0.1, method='item.get')
+            POOL.release(b, 0.4, method='item.get')
+        assert not b.is_ejected  # Slower but under slow_latency
+        POOL.release(b, 5, method='item.get')
+        assert b.is_ejected
+        assert b.LATENCY == {}
+
+    def test_slow_needs_samples(self):
+        POOL = FrontendPool(["http://a.com", "http://b.com"], slow_latency=0.5, slow_factor=3, min_samples=3)
+        a, b = POOL.FRONTENDS
+        for _ in range(3):
+            POOL.release(a, 0.1, method='item.get')
+        POOL.release(b, 5, method='item.get')
+        POOL.release(b, 5, method='item.get')
+        assert not b.is_ejected  # Too few requests to judge
+        POOL.release(b, 5, method='item.get')
+        assert b.is_ejected
+
+    def test_slow_per_method(self):
+        POOL = FrontendPool(["http://a.com", "http://b.com"], slow_latency=0.5, slow_factor=3, min_samples=2)
+        a, b = POOL.FRONTENDS
+        # Mixed workload, heavy calls on a and light ones on b, isn't a slow frontend
+        for _ in range(10):
+            POOL.release(b, 0.05, method='apiinfo.version')
+            POOL.release(a, 4, method='item.get')
+            POOL.release(b, 0.05, method='apiinfo.version')
+        assert not a.is_ejected
+        assert not b.is_ejected
+
+        # But slow for the same method is
+        for _ in range(2):
+            POOL.release(b, 1, method='item.get')
+        POOL.release(a, 4, method='item.get')
+        assert a.is_ejected
+
+    def test_hedge(self):
+        POOL = FrontendPool(["http://slow.com", "http://fast.com"], hedge_after=0.05)
+        slow, fast = POOL.FRONTENDS
+        calls = []
+
+        def fn(base_url):
+            calls.append(base_url)
+            if base_url == slow.URL:
+                time.sleep(0.2)
+            return base_url
+
+        fast.OUTSTANDING = 1  # So slow is picked first
+        assert POOL.call(fn, hedge=True) == fast.URL
+        assert calls == [slow.URL, fast.URL]
+        assert (POOL.HEDGES, POOL.HEDGE_WINS) == (1, 1)
+
+        # Writes are never hedged
+        time.sleep(0.2)  # Losing request to slow finishes
+        assert slow.OUTSTANDING == 0
+        assert POOL.call(fn, hedge=False) == slow.URL
+        assert POOL.HEDGES == 1
+
+    def test_hedge_both_fail(self):
+        POOL = FrontendPool(["http://a.com", "http://b.com"], hedge_after=0.01)
+
+        def fn(base_url):
+            time.sleep(0.05)
+            raise overload()
+
+        with pytest.raises(requests.HTTPError):
+            POOL.call(fn, hedge=True)
+        assert POOL.HEDGES == 1
+
+    @httpretty.activate
+    def test_api_failover(self):
+        for host, status in (("a.com", 503), ("b.com", 200)):
+            httpretty.register_uri(
+                httpretty.POST,
+                f"http://{host}/api_jsonrpc.php",
+                status=status,
+                body=json.dumps({"jsonrpc": "2.0", "result": host, "id": 0}),
+            )
+        events = []
+        ZAPI = ZabbixAPI(FrontendPool(["http://a.com", "http://b.com"], max_failures=1))
+        ZAPI.add_hook(events.append)
+
+        results = []
+        for _ in range(4):
+            try:
+                results.append(ZAPI.apiinfo.version())
+            except requests.HTTPError:
+                results.append("error")
+        assert results.count("error") == 1
+        assert results.count("b.com") == 3
+        assert ZAPI.POOL.FRONTENDS[0].is_ejected
+        assert [event.status for event in events if event.error] == [503]
+        assert all(event.url.startswith("http://b.com") for event in events if not event.error)
+
+    @httpretty.activate
+    def test_graph_login_per_frontend(self, tmp_path):
+        logins = []
+
+        def login_callback(request, uri, response_headers):
+            logins.append(request.headers['Host'])
+            response_headers['Set-Cookie'] = 'zbx_session=abc123; Path=/'
+            return [200, response_headers, ""]
+
+        for host in ("a.com", "b.com"):
+            httpretty.register_uri(
+                httpretty.POST,
+                f"http://{host}/api_jsonrpc.php",
+                body=json.dumps({"jsonrpc": "2.0", "result": "0424bd59b807674191e7d77572075f33", "id": 0}),
+            )
+            httpretty.register_uri(httpretty.POST, f"http://{host}/index.php", body=login_callback)
+            httpretty.register_uri(httpretty.GET, f"http://{host}/chart2.php", body=b"PNG", content_type="image/png")
+
+        graph = GraphImageAPI(["http://a.com", "http://b.com"], output_path=str(tmp_path))
+        assert graph.ZAPI.POOL is graph.POOL
+        for _ in range(4):
+            with open(graph.get_by_graph_id("4038"), 'rb') as f:
+                assert f.read() == b"PNG"
+        assert sorted(logins) == ["a.com", "b.com"]
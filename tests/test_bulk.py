@@ -0,0 +1,106 @@
+import json
+import time
+import pytest
+import threading
+import socketserver
+import httpretty
+from http.server import HTTPServer, BaseHTTPRequestHandler
+from pybix import ZabbixAPI
+from pybix.bulk import chunk_ranges
+
+
+class ZabbixHandler(BaseHTTPRequestHandler):
+    """Passes each JSON-RPC request to server.HANDLE, which returns (status, response)"""
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True  # Avoid delayed ACKs stalling keep-alive connections
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        status, response = self.server.HANDLE(body)
+        data = json.dumps(response).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+class ThreadingHTTPServer(socketserver.ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+@pytest.fixture
+def zabbix():
+    """Real local HTTP server, so concurrent bulk workers can be tested (unlike with httpretty)"""
+    server = ThreadingHTTPServer(('127.0.0.1', 0), ZabbixHandler)
+    thread = threading.Thread(target=server.serve_forever, kwargs={'poll_interval': 0.01}, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+class TestBulk(object):
+    def test_chunk_ranges(self):
+        assert chunk_ranges(list(range(10)), 4) == [(0, 4), (4, 8), (8, 10)]
+        assert chunk_ranges([], 4) == []
+
+        objects = [{'name': 'x' * 10}] * 5  # 21 bytes each including separator
+        assert chunk_ranges(objects, 10, max_bytes=50) == [(0, 2), (2, 4), (4, 5)]
+        assert chunk_ranges([{'name': 'x' * 100}, {}], 10, max_bytes=50) == [(0, 1), (1, 2)]
+
+    def test_bulk_create(self, zabbix):
+        attempts = {}
+        in_flight = [0, 0]  # Current, peak
+        lock = threading.Lock()
+
+        def handle(body):
+            names = [host['host'] for host in body['params']]
+            with lock:
+                attempts[names[0]] = attempts.get(names[0], 0) + 1
+                attempt = attempts[names[0]]
+                in_flight[0] += 1
+                in_flight[1] = max(in_flight)
+            # Earlier chunks respond slower, so chunks complete out of input order
+            time.sleep(0.05 if names[0] == "host0" else 0.02)
+            with lock:
+                in_flight[0] -= 1
+            # First attempt of the chunk starting at host3 fails
+            if names[0] == "host3" and attempt == 1:
+                return 500, {}
+            return 200, {"jsonrpc": "2.0", "result": {"hostids": [name[4:] for name in names]}, "id": body['id']}
+
+        zabbix.HANDLE = handle
+        ZAPI = ZabbixAPI(f"http://127.0.0.1:{zabbix.server_address[1]}")
+        hosts = [{'host': f"host{n}"} for n in range(24)]
+
+        result = ZAPI.bulk('host.create', hosts, chunk_size=3, workers=3)
+        assert not result.ok
+        assert result.IDS == [str(n) if not 3 <= n < 6 else None for n in range(24)]
+        assert result.failed_indexes == [3, 4, 5]
+        assert 1 < in_flight[1] <= 3  # Chunks sent concurrently, but no more than workers at once
+
+        attempts.clear()
+        result = ZAPI.bulk('host.create', hosts, chunk_size=3, workers=3, retries=1)
+        assert result.ok
+        assert result.IDS == [str(n) for n in range(24)]
+        assert attempts == {f"host{n}": 2 if n == 3 else 1 for n in range(0, 24, 3)}
+
+    @httpretty.activate
+    def test_bulk_massupdate(self):
+        httpretty.register_uri(
+            httpretty.POST,
+            "http://test.com/api_jsonrpc.php",
+            body=json.dumps({"jsonrpc": "2.0", "result": {"hostids": ["10084"]}, "id": 0}),
+        )
+        ZAPI = ZabbixAPI("http://test.com")
+
+        result = ZAPI.bulk('host.massupdate', [{'hostid': "10084"}], key='hosts', common={'status': 1})
+        assert result.IDS == ["10084"]
+        assert json.loads(httpretty.last_request().body.decode('utf-8'))['params'] == {
+            'hosts': [{'hostid': "10084"}],
+            'status': 1
+        }
@@ -0,0 +1,92 @@
+import json
+import pytest
+import httpretty
+from pybix import ZabbixAPI
+from pybix.compact import compact_records, decode_response, column, record_type
+
+
+class TestCompact(object):
+    def test_compact_records(self):
+        rows = [{"itemid": "10", "name": "CPU", "clock": "1564", "hosts": [{"hostid": "1"}]},
+                {"itemid": "11", "name": "CPU", "clock": "1565"},
+                {"itemid": "", "name": "Memory", "clock": "1566", "hosts": []}]
+        records = compact_records(rows)
+
+        assert records is rows
+        assert records[0].itemid == 10
+        assert records[0].clock == 1564
+        assert records[0].hosts == [{"hostid": "1"}]  # Nested values untouched
+        assert records[1].hosts is None
+        assert records[2].itemid == ""  # Only integer strings are converted
+        assert records[0]._asdict()["name"] == "CPU"
+        assert type(records[0]) is record_type(("itemid", "name", "clock", "hosts"))
+
+        assert list(column(records[:2], "itemid")) == [10, 11]
+        assert compact_records([{"itemid": "1"}], int_fields=())[0].itemid == "1"
+        assert compact_records("5") == "5"  # e.g. countOutput
+        assert compact_records([]) == []
+
+    def test_fields_of_all_rows(self):
+        records = compact_records([{"itemid": "1"}, {"itemid": "2", "name": "x"}])
+        assert records[0].name is None
+        assert records[1].name == "x"
+
+        # Requested output leads, Zabbix always adds the object's ID
+        records = compact_records([{"hostid": "1", "host": "a"}], output=["host", "name"])
+        assert records[0]._fields == ("host", "name", "hostid")
+        assert records[0] == ("a", None, 1)
+
+    def test_int_fields(self):
+        records = compact_records([{"uuid": "0123456789", "eventid": "5", "r_eventid": "0", "snmp_oid": "1"}])
+        assert records[0].uuid == "0123456789"
+        assert records[0].snmp_oid == "1"
+        assert (records[0].eventid, records[0].r_eventid) == (5, 0)
+
+    def test_shared_strings(self):
+        rows = [{"value_type": "".join(["0"]), "units": "".join(["b", "ps"])} for _ in range(3)]
+        records = compact_records(rows)
+        assert records[0].units is records[1].units is records[2].units
+
+    def test_decode_response(self):
+        rows = [{"itemid": "10", "name": "CPU", "hosts": [{"hostid": "1"}]},
+                {"itemid": "11", "name": "CPU", "units": "%"},
+                {"itemid": "", "name": "Memory"}]
+        content = json.dumps({"jsonrpc": "2.0", "result": rows, "id": 1}, indent=2).encode('utf-8')
+        response = decode_response(content, output=["name"])
+
+        assert response["jsonrpc"] == "2.0"
+        assert response["id"] == 1
+        records = response["result"]
+        # Same records as converting the decoded dicts, including fields first seen in later rows
+        assert records == compact_records(json.loads(content)["result"], output=["name"])
+        assert records[0]._fields == ("name", "itemid", "hosts", "units")
+        assert records[0].units is None
+        assert records[0].hosts == [{"hostid": "1"}]
+        assert records[1].itemid == 11
+        assert records[0].name is records[1].name
+        assert len({type(record) for record in records}) == 1
+
+    def test_decode_response_other(self):
+        assert decode_response(b'{"jsonrpc": "2.0", "result": "5", "id": 1}')["result"] == "5"
+        assert decode_response(b'{"result": [], "id": 1}') == {"result": [], "id": 1}
+        assert decode_response(b'{"result": ["10084"]}') == {"result": ["10084"]}
+        error = {"jsonrpc": "2.0", "error": {"code": -32602, "message": "Invalid params."}, "id": 1}
+        assert decode_response(json.dumps(error)) == error
+        for content in (b'', b'{"result": [{"itemid": "1"}', b'{"result": []} x', b'{"result" []}', b'{1: 2}'):
+            with pytest.raises(ValueError):
+                decode_response(content)
+
+    @httpretty.activate
+    def test_do_request_compact(self):
+        httpretty.register_uri(
+            httpretty.POST,
+            "http://test.com/api_jsonrpc.php",
+            body=json.dumps({"jsonrpc": "2.0", "result": [{"hostid": "10084", "host": "Zabbix server"}], "id": 0}),
+        )
+        ZAPI = ZabbixAPI("http://test.com", coalesce=True)
+        hosts = ZAPI.do_request('host.get', {'output': ['hostid', 'host']}, compact=True)['result']
+        assert hosts[0].hostid == 10084
+        assert hosts[0].host == "Zabbix server"
+        assert ZAPI.host.get(output=['hostid', 'host'])[0] == {"hostid": "10084", "host": "Zabbix server"}
+        assert ZAPI.host.get(output=['hostid', 'host'], compact=True)[0].hostid == 10084
+        assert 'compact' not in json.loads(httpretty.last_request().body.decode('utf-8'))['params']
@@ -0,0 +1,123 @@
+import json
+import asyncio
+import httpretty
+from pybix import ZabbixAPI
+
+
+class TestFeed(object):
+    EVENTS = [{"eventid": str(eventid), "clock": str(1000 + eventid), "name": f"event{eventid}"}
+              for eventid in range(1, 8)]
+
+    def register(self, requests):
+        def callback(request, uri, response_headers):
+            body = json.loads(request.body.decode('utf-8'))
+            params = body['params']
+            requests.append(params)
+            eventid_from = int(params.get('eventid_from', 0))
+            events = [event for event in self.EVENTS
+                      if int(event['eventid']) >= eventid_from and int(event['clock']) >= params.get('time_from', 0)]
+            response = {"jsonrpc": "2.0", "result": events[:params['limit']], "id": body['id']}
+            return [200, response_headers, json.dumps(response)]
+
+        httpretty.register_uri(httpretty.POST, "http://test.com/api_jsonrpc.php", body=callback)
+
+    @httpretty.activate
+    def test_poll(self):
+        requests = []
+        self.register(requests)
+        ZAPI = ZabbixAPI("http://test.com")
+        feed = ZAPI.follow('event', params={'source': 0}, output=['name'], since=1003, limit=3)
+
+        assert [event['eventid'] for event in feed.poll()] == ["3", "4", "5"]
+        assert requests[0]['time_from'] == 1003
+        assert requests[0]['source'] == 0
+        assert requests[0]['output'] == ['name', 'eventid', 'clock']
+        assert requests[0]['sortfield'] == 'eventid'
+        assert feed.FULL
+
+        assert [event['eventid'] for event in feed.poll()] == ["6", "7"]
+        assert requests[1]['eventid_from'] == "6"
+        assert 'time_from' not in requests[1]
+        assert feed.poll() == []
+
+    @httpretty.activate
+    def test_problem(self):
+        requests = []
+        self.register(requests)
+        ZAPI = ZabbixAPI("http://test.com")
+        feed = ZAPI.follow('problem', since=1006)
+
+        assert [event['eventid'] for event in feed.poll()] == ["6", "7"]
+        assert feed.poll() == []
+        assert requests[1]['eventid_from'] == "8"
+        assert 'time_from' not in requests[1]
+
+    @httpretty.activate
+    def test_problem_burst_over_limit(self):
+        requests = []
+        self.EVENTS = [{"eventid": str(eventid), "clock": "1000", "name": f"event{eventid}"} for eventid in range(1, 6)]
+        self.register(requests)
+        feed = ZabbixAPI("http://test.com").follow('problem', since=1000, limit=3)
+
+        assert [event['eventid'] for event in feed.poll()] == ["1", "2", "3"]
+        assert feed.FULL
+        assert [event['eventid'] for event in feed.poll()] == ["4", "5"]
+        assert [request['limit'] for request in requests] == [3, 3]
+        assert feed.poll() == []
+
+    @httpretty.activate
+    def test_problem_late_arrival(self):
+        requests = []
+        self.EVENTS = [{"eventid": "1", "clock": "1100", "name": "event1"}]
+        self.register(requests)
+        feed = ZabbixAPI("http://test.com").follow('problem', since=1000)
+        assert [event['eventid'] for event in feed.poll()] == ["1"]
+
+        # e.g. buffered by a proxy, so older clock than already seen but still a higher eventid
+        self.EVENTS.append({"eventid": "2", "clock": "1050", "name": "event2"})
+        assert [event['eventid'] for event in feed.poll()] == ["2"]
+        assert requests[-1]['eventid_from'] == "2"
+        assert feed.LAST_CLOCK == 1100
+
+    def test_backoff(self):
+        feed = ZabbixAPI("http://test.com").follow('event', interval=1, max_interval=5)
+        assert [feed._next_interval([]) for _ in range(4)] == [2, 4, 5, 5]
+        assert feed._next_interval([{}]) == 1
+        feed.FULL = True
+        assert feed._next_interval([{}]) == 0
+
+    @httpretty.activate
+    def test_checkpoint(self, tmp_path):
+        requests = []
+        self.register(requests)
+        checkpoint = str(tmp_path / "events.json")
+        ZAPI = ZabbixAPI("http://test.com")
+
+        feed = iter(ZAPI.follow('event', checkpoint=checkpoint, since=0, limit=4))
+        assert [next(feed)['eventid'] for _ in range(4)] == ["1", "2", "3", "4"]
+        # Checkpoint saved once the batch is consumed, i.e. when asking for the next record
+        assert next(feed)['eventid'] == "5"
+        feed.close()
+
+        feed = ZAPI.follow('event', checkpoint=checkpoint)
+        assert feed.LAST_ID == 4
+        assert [event['eventid'] for event in feed.poll()] == ["5", "6", "7"]
+
+    @httpretty.activate
+    def test_async(self):
+        requests = []
+        self.register(requests)
+        feed = ZabbixAPI("http://test.com").follow('event', since=0, limit=5)
+
+        async def take(count):
+            events = []
+            async for event in feed:
+                events.append(event['eventid'])
+                if len(events) == count:
+                    return events
+
+        loop = asyncio.new_event_loop()
+        try:
+            assert loop.run_until_complete(take(7)) == [str(eventid) for eventid in range(1, 8)]
+        finally:
+            loop.close()
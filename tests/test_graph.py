@@ -0,0 +1,59 @@
+import json
+import httpretty
+from pybix import GraphImageAPI
+
+
+class TestGraph(object):
+    def __register_uris(self, chart_responses):
+        self.logins = 0
+
+        def login_callback(request, uri, response_headers):
+            self.logins += 1
+            response_headers['Set-Cookie'] = 'zbx_session=abc123; Path=/'
+            return [200, response_headers, ""]
+
+        httpretty.register_uri(
+            httpretty.POST,
+            "http://test.com/api_jsonrpc.php",
+            body=json.dumps({"jsonrpc": "2.0", "result": "0424bd59b807674191e7d77572075f33", "id": 0}),
+        )
+        httpretty.register_uri(
+            httpretty.POST,
+            "http://test.com/index.php",
+            body=login_callback,
+        )
+        httpretty.register_uri(
+            httpretty.GET,
+            "http://test.com/chart2.php",
+            responses=chart_responses,
+        )
+
+    @httpretty.activate
+    def test_lazy_login(self, tmp_path):
+        self.__register_uris([httpretty.Response(body=b"PNG", content_type="image/png")])
+
+        graph = GraphImageAPI("http://test.com", output_path=str(tmp_path))
+        assert graph.SESSION is graph.ZAPI.SESSION
+        assert not graph.is_logged_in
+        assert self.logins == 0
+
+        graph.get_by_graph_id("4038")
+        graph.get_by_graph_id("4038")
+        assert graph.is_logged_in
+        assert self.logins == 1
+
+    @httpretty.activate
+    def test_relogin_on_expired_session(self, tmp_path):
+        self.__register_uris([
+            httpretty.Response(body=b"PNG", content_type="image/png"),
+            httpretty.Response(body="<html>login</html>", content_type="text/html"),
+            httpretty.Response(body=b"PNG", content_type="image/png"),
+        ])
+
+        graph = GraphImageAPI("http://test.com", output_path=str(tmp_path))
+        graph.get_by_graph_id("4038")
+        file_name = graph.get_by_graph_id("4038")
+
+        assert self.logins == 2
+        with open(file_name, 'rb') as f:
+            assert f.read() == b"PNG"
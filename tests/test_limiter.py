@@ -0,0 +1,96 @@
+import time
+import json
+import threading
+import pytest
+import httpretty
+import requests
+from pybix import ZabbixAPI
+from pybix.limiter import AdaptiveLimiter, TokenBucket, is_overload
+
+
+class TestLimiter(object):
+    def test_token_bucket(self):
+        BUCKET = TokenBucket(rate=100, burst=5)
+        start = time.perf_counter()
+        waits = [BUCKET.acquire() for _ in range(10)]
+
+        assert waits[:5] == [0.0] * 5
+        assert all(wait > 0 for wait in waits[5:])
+        assert time.perf_counter() - start >= 0.04
+
+    def test_increase_and_decrease(self):
+        LIMITER = AdaptiveLimiter(initial_limit=4, max_limit=5, latency_target=1.0)
+        for _ in range(20):
+            LIMITER.acquire()
+            LIMITER.release(0.01)
+        assert LIMITER.LIMIT == 5
+
+        LIMITER.acquire()
+        LIMITER.release(0.01, overloaded=True)
+        assert LIMITER.LIMIT == 2.5
+
+        # Only decreases once per round trip
+        LIMITER.acquire()
+        LIMITER.release(0.01, overloaded=True)
+        assert LIMITER.LIMIT == 2.5
+
+        time.sleep(0.2)
+        LIMITER.acquire()
+        LIMITER.release(2.0)
+        assert LIMITER.LIMIT == 1.25
+
+        time.sleep(0.2)
+        LIMITER.acquire()
+        LIMITER.release(0.01, overloaded=True)
+        assert LIMITER.LIMIT == 1
+
+    def test_concurrency_limit(self):
+        LIMITER = AdaptiveLimiter(initial_limit=2, max_limit=2)
+        active = []
+        peak = []
+        lock = threading.Lock()
+
+        def work():
+            with LIMITER.slot():
+                with lock:
+                    active.append(1)
+                    peak.append(len(active))
+                time.sleep(0.01)
+                with lock:
+                    active.pop()
+
+        threads = [threading.Thread(target=work) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert max(peak) == 2
+
+    def test_for_server(self):
+        assert AdaptiveLimiter.for_server("http://test.com/zabbix") is \
+            AdaptiveLimiter.for_server("http://test.com/zabbix/api_jsonrpc.php")
+        assert AdaptiveLimiter.for_server("http://test.com") is not AdaptiveLimiter.for_server("http://other.com")
+
+    def test_is_overload(self):
+        assert is_overload(requests.Timeout())
+        assert not is_overload(ValueError())
+
+    @httpretty.activate
+    def test_api_backs_off_on_server_error(self):
+        httpretty.register_uri(
+            httpretty.POST,
+            "http://test.com/api_jsonrpc.php",
+            responses=[httpretty.Response(body="", status=503),
+                       httpretty.Response(body=json.dumps({"jsonrpc": "2.0", "result": "4.0.0", "id": 1}))],
+        )
+        LIMITER = AdaptiveLimiter(initial_limit=8)
+        ZAPI = ZabbixAPI("http://test.com", limiter=LIMITER)
+        events = []
+        ZAPI.add_hook(events.append)
+
+        with pytest.raises(requests.HTTPError):
+            ZAPI.api_version
+        assert LIMITER.LIMIT == 4
+        assert ZAPI.api_version == "4.0.0"
+        assert LIMITER.IN_FLIGHT == 0
+        assert 'throttle' in events[-1].timings
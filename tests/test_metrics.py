@@ -0,0 +1,37 @@
+from pybix.metrics import MetricsAggregator, RequestEvent, percentile
+
+
+def event(method, total, error=None):
+    return RequestEvent(method, "http://test.com/api_jsonrpc.php", 200, error, 100, 1000,
+                        {'wait': total / 2, 'total': total}, 0, False)
+
+
+class TestMetrics(object):
+    def test_percentile(self):
+        values = list(range(1, 101))
+        assert percentile(values, 50) == 50
+        assert percentile(values, 99) == 99
+        assert percentile(values[::-1], 100) == 100
+        assert percentile([], 50) == 0.0
+
+    def test_summary(self):
+        METRICS = MetricsAggregator()
+        for total in range(1, 101):
+            METRICS(event("host.get", total / 1000))
+        METRICS(event("item.get", 0.5, error=ValueError()))
+
+        summary = METRICS.summary()
+        assert summary["host.get"]["count"] == 100
+        assert summary["host.get"]["p95"] == 0.095
+        assert summary["host.get"]["response_bytes"] == 100000
+        assert summary["item.get"]["errors"] == 1
+        assert "host.get" in METRICS.report()
+
+    def test_prometheus(self):
+        METRICS = MetricsAggregator()
+        METRICS(event("host.get", 0.25))
+        text = METRICS.prometheus()
+
+        assert 'pybix_request_duration_seconds{method="host.get",quantile="0.99"} 0.25' in text
+        assert 'pybix_request_duration_seconds_count{method="host.get"} 1' in text
+        assert 'pybix_request_sent_bytes_total{method="host.get"} 100' in text
@@ -0,0 +1,163 @@
+import time
+import asyncio
+import threading
+import socketserver
+import pytest
+from pybix.sender import (ZabbixSender, ZabbixMetric, ZBXD_HEADER, ZBXD_COMPRESSED,
+                          pack, unpack)
+
+
+class TrapperHandler(socketserver.BaseRequestHandler):
+    """Stub trapper that fails values of 'fail' and (like Zabbix) closes after each response
+        unless the server is set to keep_alive. The next server.drop requests are closed without
+        processing or responding, and responses are sent server.delay seconds after processing
+    """
+
+    def read(self, length):
+        data = b''
+        while len(data) < length:
+            chunk = self.request.recv(length - len(data))
+            if not chunk:
+                raise EOFError
+            data += chunk
+        return data
+
+    def handle(self):
+        with self.server.lock:
+            self.server.connections += 1
+        while True:
+            try:
+                header = self.read(ZBXD_HEADER.size)
+            except EOFError:
+                return
+            with self.server.lock:
+                self.server.flags.append(header[4])
+            request = unpack(header, self.read)
+            with self.server.lock:
+                if self.server.drop:
+                    self.server.drop -= 1
+                    return
+            failed = sum(1 for value in request['data'] if value['value'] == 'fail')
+            with self.server.lock:
+                self.server.values.extend(request['data'])
+            total = len(request['data'])
+            time.sleep(self.server.delay)
+            self.request.sendall(pack({
+                'response': 'success',
+                'info': f"processed: {total - failed}; failed: {failed}; total: {total}; seconds spent: 0.000100"
+            }))
+            if not self.server.keep_alive:
+                return
+
+
+@pytest.fixture
+def trapper():
+    server = socketserver.ThreadingTCPServer(('127.0.0.1', 0), TrapperHandler)
+    server.daemon_threads = True
+    server.lock = threading.Lock()
+    server.connections = 0
+    server.values = []
+    server.flags = []
+    server.keep_alive = False
+    server.drop = 0
+    server.delay = 0
+    threading.Thread(target=server.serve_forever, args=(0.01,), daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def metrics(count, fail_every=0):
+    return [ZabbixMetric("server1", "custom.metric", "fail" if fail_every and n % fail_every == 0 else n)
+            for n in range(count)]
+
+
+class TestSender(object):
+    def test_send_batches(self, trapper):
+        with ZabbixSender('127.0.0.1', trapper.server_address[1], chunk_size=100) as SENDER:
+            response = SENDER.send(metrics(250, fail_every=10))
+
+        assert len(response.BATCHES) == 3
+        assert response.total == 250
+        assert response.failed == 25
+        assert response.processed == 225
+        assert [batch.total for batch in response.BATCHES] == [100, 100, 50]
+        assert len(trapper.values) == 250
+        assert trapper.values[1] == {'host': 'server1', 'key': 'custom.metric', 'value': '1'}
+
+    def test_clock(self, trapper):
+        with ZabbixSender('127.0.0.1', trapper.server_address[1]) as SENDER:
+            SENDER.send([ZabbixMetric("server1", "custom.metric", 1.5, 1564790400, 5)])
+
+        assert trapper.values[0]['clock'] == 1564790400
+        assert trapper.values[0]['ns'] == 5
+
+    def test_compress(self, trapper):
+        with ZabbixSender('127.0.0.1', trapper.server_address[1], compress=True) as SENDER:
+            response = SENDER.send(metrics(10))
+
+        assert response.processed == 10
+        assert trapper.flags[0] & ZBXD_COMPRESSED
+
+    def test_reuse_connection(self, trapper):
+        trapper.keep_alive = True
+        with ZabbixSender('127.0.0.1', trapper.server_address[1], chunk_size=10) as SENDER:
+            assert SENDER.send(metrics(50)).processed == 50
+        assert trapper.connections == 1
+
+    def test_reconnect_after_server_close(self, trapper):
+        with ZabbixSender('127.0.0.1', trapper.server_address[1], chunk_size=10) as SENDER:
+            assert SENDER.send(metrics(50)).processed == 50
+        assert trapper.connections == 5
+
+    def test_retry_when_closed_before_response(self, trapper):
+        trapper.keep_alive = True
+        with ZabbixSender('127.0.0.1', trapper.server_address[1], chunk_size=10) as SENDER:
+            assert SENDER.send(metrics(10)).processed == 10
+            trapper.drop = 1
+            response = SENDER.send(metrics(10))
+
+        assert response.processed == 10
+        assert not response.errors
+        assert len(trapper.values) == 20
+        assert trapper.connections == 2
+
+    def test_no_retry_after_timeout(self, trapper):
+        trapper.keep_alive = True
+        with ZabbixSender('127.0.0.1', trapper.server_address[1], chunk_size=10, timeout=0.2) as SENDER:
+            assert SENDER.send(metrics(10)).processed == 10
+            trapper.delay = 0.5
+            response = SENDER.send(metrics(10))
+
+        assert response.failed == 10
+        assert len(response.errors) == 1
+        # Server processed the batch but responded too late, so it must not have been sent again
+        time.sleep(0.7)
+        assert len(trapper.values) == 20
+        assert trapper.connections == 1
+
+    def test_workers(self, trapper):
+        with ZabbixSender('127.0.0.1', trapper.server_address[1], chunk_size=10, workers=4) as SENDER:
+            response = SENDER.send(metrics(1000))
+
+        assert response.processed == 1000
+        assert len(trapper.values) == 1000
+
+    def test_async_send(self, trapper):
+        SENDER = ZabbixSender('127.0.0.1', trapper.server_address[1], chunk_size=10, workers=4)
+        loop = asyncio.new_event_loop()
+        try:
+            response = loop.run_until_complete(SENDER.async_send(metrics(100, fail_every=5)))
+        finally:
+            loop.close()
+
+        assert response.total == 100
+        assert response.failed == 20
+        assert len(response.BATCHES) == 10
+
+    def test_connection_error(self):
+        with ZabbixSender('127.0.0.1', 1, timeout=1) as SENDER:
+            response = SENDER.send(metrics(10))
+
+        assert response.failed == 10
+        assert len(response.errors) == 1
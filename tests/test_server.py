@@ -0,0 +1,196 @@
+import os
+import stat
+import pytest
+import json
+import socket
+import threading
+import httpretty
+from concurrent.futures import ThreadPoolExecutor
+from pybix.api import ZabbixAPIException
+from pybix import server as pybix_server
+from pybix.server import PybixServer
+
+
+class TestServer(object):
+    @httpretty.activate
+    def test_do_request(self):
+        responses = [
+            httpretty.Response(body=json.dumps({"jsonrpc": "2.0", "result": "0424bd59b807674191e7d77572075f33", "id": 0})),
+            httpretty.Response(body=json.dumps({"jsonrpc": "2.0", "result": "4.0.0", "id": 1})),
+        ]
+        httpretty.register_uri(httpretty.POST,
+                               "http://test.com/api_jsonrpc.php",
+                               responses=responses)
+
+        PYBIX = PybixServer("http://test.com", "Admin", "zabbix")
+        assert PYBIX.ZAPI.AUTH == "0424bd59b807674191e7d77572075f33"
+        assert PYBIX.do_request("apiinfo.version") == "4.0.0"
+
+    @httpretty.activate
+    def test_do_request_relogin(self):
+        responses = [
+            httpretty.Response(body=json.dumps({"jsonrpc": "2.0", "result": "0424bd59b807674191e7d77572075f33", "id": 0})),
+            httpretty.Response(body=json.dumps({
+                "jsonrpc": "2.0",
+                "error": {"code": -32602, "message": "Invalid params.", "data": "Session terminated, re-login, please."},
+                "id": 1})),
+            httpretty.Response(body=json.dumps({"jsonrpc": "2.0", "result": "16a46baf181ef9602e1687f3110abf8a", "id": 2})),
+            httpretty.Response(body=json.dumps({"jsonrpc": "2.0", "result": [], "id": 3})),
+        ]
+        httpretty.register_uri(httpretty.POST,
+                               "http://test.com/api_jsonrpc.php",
+                               responses=responses)
+
+        PYBIX = PybixServer("http://test.com", "Admin", "zabbix")
+        assert PYBIX.do_request("host.get") == []
+        assert PYBIX.ZAPI.AUTH == "16a46baf181ef9602e1687f3110abf8a"
+        assert json.loads(httpretty.last_request().body.decode('utf-8'))['auth'] == PYBIX.ZAPI.AUTH
+
+    @httpretty.activate
+    def test_do_request_relogin_once(self, monkeypatch):
+        httpretty.register_uri(httpretty.POST,
+                               "http://test.com/api_jsonrpc.php",
+                               body=json.dumps({"jsonrpc": "2.0", "result": "0424bd59b807674191e7d77572075f33", "id": 0}))
+        PYBIX = PybixServer("http://test.com", "Admin", "zabbix")
+        expired = threading.Barrier(5)
+        logins = []
+
+        def do_request(method, params=None):
+            if PYBIX.ZAPI.AUTH == "0424bd59b807674191e7d77572075f33":
+                expired.wait(timeout=5)  # All requests fail with the expired session before any logs back in
+                raise ZabbixAPIException("Session terminated, re-login, please.", -32602)
+            return {"result": []}
+
+        def login(user, password):
+            logins.append(user)
+            PYBIX.ZAPI.AUTH = "16a46baf181ef9602e1687f3110abf8a"
+
+        monkeypatch.setattr(PYBIX.ZAPI, 'do_request', do_request)
+        monkeypatch.setattr(PYBIX.ZAPI, 'login', login)
+        with ThreadPoolExecutor(max_workers=5) as executor:
+            assert list(executor.map(lambda _: PYBIX.do_request("host.get"), range(5))) == [[]] * 5
+        assert logins == ["Admin"]
+
+    @httpretty.activate
+    def test_reserved_methods(self):
+        httpretty.register_uri(httpretty.POST,
+                               "http://test.com/api_jsonrpc.php",
+                               body=json.dumps({"jsonrpc": "2.0", "result": "0424bd59b807674191e7d77572075f33", "id": 0}))
+
+        PYBIX = PybixServer("http://test.com", "Admin", "zabbix")
+        with pytest.raises(ZabbixAPIException):
+            PYBIX.do_request("user.logout")
+
+
+class StubPybix(object):
+    """Stands in for PybixServer so the HTTP handler can be tested without Zabbix"""
+
+    def __init__(self):
+        self.ZAPI = type('ZAPI', (object, ), {'AUTH': 'abc123'})()
+        self.calls = []
+
+    def do_request(self, method, params=None):
+        self.calls.append((method, params))
+        return "4.0.0"
+
+    def graph_image(self, search_type, **kwargs):
+        self.calls.append((search_type, kwargs))
+        return "graph.png"
+
+
+def http_request(address, method, path, body=b""):
+    """Send one HTTP/1.1 request over a TCP (tuple address) or unix (str address) socket"""
+    family = socket.AF_UNIX if isinstance(address, str) else socket.AF_INET
+    with socket.socket(family, socket.SOCK_STREAM) as client:
+        client.settimeout(5)
+        client.connect(address)
+        client.sendall(f"{method} {path} HTTP/1.1\r\nHost: localhost\r\nConnection: close\r\n"
+                       f"Content-Length: {len(body)}\r\n\r\n".encode('utf-8') + body)
+        response = b""
+        while True:
+            chunk = client.recv(65536)
+            if not chunk:
+                break
+            response += chunk
+    head, _, data = response.partition(b"\r\n\r\n")
+    return int(head.split(b" ")[1]), json.loads(data)
+
+
+@pytest.fixture(params=['tcp', 'unix'])
+def httpd(request, tmp_path):
+    if request.param == 'tcp':
+        server = pybix_server.make_server(StubPybix(), port=0)
+        address = server.server_address
+    else:
+        if not hasattr(socket, 'AF_UNIX'):
+            pytest.skip("No unix sockets on this platform")
+        address = str(tmp_path / "pybix.sock")
+        server = pybix_server.make_server(StubPybix(), socket_path=address)
+    thread = threading.Thread(target=server.serve_forever, kwargs={'poll_interval': 0.01}, daemon=True)
+    thread.start()
+    yield server, address
+    server.shutdown()
+    server.server_close()
+
+
+class TestRequestHandler(object):
+    def test_health(self, httpd):
+        server, address = httpd
+        assert http_request(address, "GET", "/health") == (200, {'authenticated': True})
+
+    def test_jsonrpc(self, httpd):
+        server, address = httpd
+        body = json.dumps({"jsonrpc": "2.0", "method": "apiinfo.version", "params": {}, "id": 7}).encode('utf-8')
+        assert http_request(address, "POST", "/api_jsonrpc.php", body) == \
+            (200, {"jsonrpc": "2.0", "result": "4.0.0", "id": 7})
+
+    @pytest.mark.parametrize('body', [b'[{"method": "apiinfo.version"}]', b'"x"', b'5'])
+    def test_jsonrpc_not_object(self, httpd, body):
+        server, address = httpd
+        status, response = http_request(address, "POST", "/api_jsonrpc.php", body)
+        assert status == 400
+        assert response['error']['code'] == -32600
+        assert server.PYBIX.calls == []
+
+    def test_jsonrpc_missing_method(self, httpd):
+        server, address = httpd
+        status, response = http_request(address, "POST", "/api_jsonrpc.php", b'{"params": {}, "id": 3}')
+        assert status == 400
+        assert response['error']['data'] == 'Missing method'
+        assert response['id'] == 3
+
+    def test_jsonrpc_dispatch_key_error(self, httpd, monkeypatch):
+        server, address = httpd
+
+        def do_request(method, params=None):
+            raise KeyError('result')
+
+        monkeypatch.setattr(server.PYBIX, 'do_request', do_request)
+        status, response = http_request(address, "POST", "/api_jsonrpc.php", b'{"method": "host.get", "id": 4}')
+        assert status == 502
+        assert response['error']['code'] == -32300
+
+    def test_graph_image(self, httpd):
+        server, address = httpd
+        assert http_request(address, "POST", "/graphimage/graph_id", b'{"graph_id": "4038"}') == \
+            (200, {'result': "graph.png"})
+        assert http_request(address, "POST", "/graphimage/graph_id", b'["4038"]')[0] == 400
+        assert server.PYBIX.calls == [("graph_id", {"graph_id": "4038"})]
+
+
+@pytest.mark.skipif(not hasattr(socket, 'AF_UNIX'), reason="No unix sockets on this platform")
+class TestMakeServer(object):
+    def test_socket_owner_only(self, tmp_path):
+        path = str(tmp_path / "pybix.sock")
+        for _ in range(2):  # Stale socket from a previous run is replaced
+            server = pybix_server.make_server(StubPybix(), socket_path=path)
+            server.server_close()
+            assert stat.S_ISSOCK(os.stat(path).st_mode)
+            assert stat.S_IMODE(os.stat(path).st_mode) == 0o600
+
+    def test_refuse_replace_file(self, tmp_path):
+        path = tmp_path / "notes.txt"
+        path.write_text("keep me")
+        with pytest.raises(ValueError):
+            pybix_server.make_server(StubPybix(), socket_path=str(path))
+        assert path.read_text() == "keep me"
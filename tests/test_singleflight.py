@@ -0,0 +1,34 @@
+import time
+import threading
+import pytest
+from concurrent.futures import ThreadPoolExecutor
+from pybix.singleflight import SingleFlight
+
+
+class TestSingleFlight(object):
+    def test_shared_error(self):
+        FLIGHT = SingleFlight()
+        started = threading.Event()
+        release = threading.Event()
+
+        def fn():
+            started.set()
+            release.wait()
+            raise ValueError("failed")
+
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            leader = executor.submit(FLIGHT.do, "key", fn)
+            started.wait()
+            follower = executor.submit(FLIGHT.do, "key", lambda: "unused")
+            time.sleep(0.1)  # Let follower join the in-flight call
+            release.set()
+            with pytest.raises(ValueError):
+                leader.result()
+            with pytest.raises(ValueError):
+                follower.result()
+        assert FLIGHT.in_flight == 0
+
+    def test_not_cached(self):
+        FLIGHT = SingleFlight()
+        assert FLIGHT.do("key", lambda: 1) == (1, False)
+        assert FLIGHT.do("key", lambda: 2) == (2, False)
@@ -0,0 +1,109 @@
+import json
+import pytest
+import httpretty
+from pybix import ZabbixAPI
+from pybix.snapshot import ConfigSnapshot, fingerprint, normalise_export, snapshot_order
+
+
+class TestSnapshot(object):
+    def register(self):
+        self.hosts = {
+            "10084": {"hostid": "10084", "host": "Zabbix server", "status": "0", "items": [{"key_": "agent.ping"}]},
+            "10085": {"hostid": "10085", "host": "web01", "status": "0", "items": []},
+        }
+        self.exports = []
+
+        def callback(request, uri, response_headers):
+            body = json.loads(request.body.decode('utf-8'))
+            if body['method'] == 'host.get':
+                result = list(self.hosts.values())
+            elif body['method'] == 'configuration.export':
+                hostid = body['params']['options']['hosts'][0]
+                self.exports.append(hostid)
+                result = json.dumps({"zabbix_export": {"version": "4.0", "date": "2019-08-03T06:00:00Z",
+                                                       "hosts": [self.hosts[hostid]]}})
+            else:
+                result = True
+            return [200, response_headers, json.dumps({"jsonrpc": "2.0", "result": result, "id": body['id']})]
+
+        httpretty.register_uri(httpretty.POST, "http://test.com/api_jsonrpc.php", body=callback)
+
+    def test_fingerprint(self):
+        assert fingerprint({"a": [{"b": "1"}, {"b": "2"}]}) == fingerprint({"a": [{"b": "2"}, {"b": "1"}]})
+        assert fingerprint({"a": "1"}) != fingerprint({"a": "2"})
+        assert normalise_export('{"zabbix_export": {"version": "4.0", "date": "x"}}') == \
+            '{\n  "zabbix_export": {\n    "version": "4.0"\n  }\n}\n'
+
+    @httpretty.activate
+    def test_incremental(self, tmp_path):
+        self.register()
+        SNAPSHOT = ConfigSnapshot(ZabbixAPI("http://test.com"), str(tmp_path), types=('hosts', ), workers=1)
+
+        first = SNAPSHOT.take()
+        assert sorted(first.added) == [("hosts", "10084"), ("hosts", "10085")]
+        assert sorted(self.exports) == ["10084", "10085"]
+
+        # Nothing changed, so nothing exported
+        self.exports.clear()
+        second = SNAPSHOT.take()
+        assert self.exports == []
+        assert len(second.unchanged) == 2
+        assert SNAPSHOT.changes() == []
+
+        # Only the changed host is exported, removed host is recorded
+        self.hosts["10084"]["items"].append({"key_": "system.cpu.load"})
+        del self.hosts["10085"]
+        third = SNAPSHOT.take()
+        assert self.exports == ["10084"]
+        assert third.modified == [("hosts", "10084")]
+        assert third.removed == [("hosts", "10085")]
+
+        assert SNAPSHOT.snapshots() == [first.name, second.name, third.name]
+        assert [(change.id, change.status) for change in SNAPSHOT.changes()] == \
+            [("10084", "modified"), ("10085", "removed")]
+        diff = SNAPSHOT.diff()
+        assert f"+++ {third.name}/hosts/Zabbix server" in diff
+        assert '+            "key_": "system.cpu.load"' in diff
+        assert "+++ /dev/null" in diff
+
+        # Content addressed, so unchanged web01 export from first snapshot is stored once
+        assert len(list((tmp_path / "objects").glob("*/*"))) == 3
+
+        self.exports.clear()
+        SNAPSHOT.take(full=True)
+        assert self.exports == ["10084"]
+
+    @httpretty.activate
+    def test_same_second_order(self, tmp_path, monkeypatch):
+        self.register()
+        SNAPSHOT = ConfigSnapshot(ZabbixAPI("http://test.com"), str(tmp_path), types=('hosts', ), workers=1)
+        monkeypatch.setattr('pybix.snapshot.time.gmtime', lambda *args: (2019, 8, 3, 6, 0, 0, 5, 215, 0))
+        names = []
+        for n in range(12):
+            self.hosts["10084"]["status"] = str(n)
+            names.append(SNAPSHOT.take().name)
+
+        assert names[10] == "20190803T060000Z-10"
+        assert SNAPSHOT.snapshots() == names
+        # Previous of -10 is -9, not -1 as plain string order would give
+        assert [change.id for change in SNAPSHOT.changes(new=names[10])] == ["10084"]
+        assert '"status": "9"' in SNAPSHOT.diff(new=names[10])
+        assert snapshot_order("20190803T060000Z-2") < snapshot_order("20190803T060000Z-10")
+
+    @httpretty.activate
+    def test_restore(self, tmp_path):
+        self.register()
+        ZAPI = ZabbixAPI("http://test.com")
+        SNAPSHOT = ConfigSnapshot(ZAPI, str(tmp_path), types=('hosts', ), workers=1)
+        name = SNAPSHOT.take().name
+
+        rules = {'hosts': {'createMissing': True, 'updateExisting': True}}
+        assert SNAPSHOT.restore(name, 'hosts', '10085', rules) is True
+        request = json.loads(httpretty.last_request().body.decode('utf-8'))
+        assert request['method'] == 'configuration.import'
+        assert json.loads(request['params']['source'])['zabbix_export']['hosts'][0]['host'] == "web01"
+
+        with pytest.raises(ValueError):
+            SNAPSHOT.restore(name, 'hosts', '99999', rules)
+        with pytest.raises(ValueError):
+            ConfigSnapshot(ZAPI, str(tmp_path), types=('maps', ))